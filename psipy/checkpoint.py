@@ -0,0 +1,79 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Atomic checkpoints of raw solver arrays.
+
+A checkpoint is an uncompressed .npz archive of plain arrays, nothing is
+pickled. It is written to a temporary file which is then renamed over
+the previous checkpoint, so an interrupted write never leaves a
+corrupt checkpoint behind.
+
+AUTHOR: Luke Siemens
+"""
+
+import os
+
+import numpy as np
+
+def save(path, **arrays):
+    """
+    Atomically write the given arrays to path.
+
+    Parameters
+    ----------
+    path : string
+        The checkpoint file
+    **arrays : array_like
+        The arrays to store, by name
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        np.savez(tmp_file, **arrays)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.rename(tmp_path, path)
+
+def load(path):
+    """
+    Returns a dictionary of the arrays stored in the checkpoint path.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return dict((name, data[name]) for name in data.files)
+
+def exists(path):
+    return path is not None and os.path.exists(path)
+
+def remove(path):
+    if exists(path):
+        os.remove(path)
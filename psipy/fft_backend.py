@@ -0,0 +1,460 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Interchangeable FFT backends for the schrodinger equation solvers.
+
+All backends share the same interface: fft and ifft transform along the
+given axes (the last axis by default) and write the result into out if
+a preallocated buffer is given. The fftw backend transforms directly
+into out, fftpack and scipy.fft copy the input into out and transform it
+there in place (fftpack only for 1D transforms, scipy.fft where it
+can), and numpy.fft, which has neither, allocates the result and copies
+it into out. rfft and irfft transform real arrays
+along the last axis, keeping only the non-negative frequencies, and
+dst/idst and dct/idct are the type I sine and cosine transforms used for
+Dirichlet and Neumann boundaries.
+Buffers should be allocated with the backend's empty method so that they
+satisfy any alignment requirements.
+
+Available backends
+- "fftpack" : scipy.fftpack (default, single threaded)
+- "numpy"   : numpy.fft
+- "scipy"   : scipy.fft, multithreaded with workers (scipy >= 1.4)
+- "fftw"    : planned FFTs using pyfftw, multithreaded with workers
+
+AUTHOR: Luke Siemens
+"""
+
+import numpy as np
+from scipy import fftpack
+
+try:
+    import scipy.fft as _scipy_fft
+except ImportError:
+    _scipy_fft = None
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+class FFTBackend(object):
+    """
+    Base class of the FFT backends. Subclasses implement _transform,
+    backends which need plans also implement _make_plan. Plans are
+    cached per (shape, dtype, axes, direction).
+    """
+    name = None
+    # True if _transform takes overwrite, and can transform in place
+    in_place = False
+
+    def __init__(self, workers=1):
+        assert workers >= 1
+        self.workers = workers
+        self._plans = {}
+
+    def empty(self, shape, dtype=complex):
+        return np.empty(shape, dtype=dtype)
+
+    def plan(self, shape, dtype, axes=(-1,), inverse=False):
+        key = (tuple(shape), np.dtype(dtype), tuple(axes), inverse)
+        try:
+            return self._plans[key]
+        except KeyError:
+            plan = self._make_plan(*key)
+            self._plans[key] = plan
+            return plan
+
+    def clear_plans(self):
+        self._plans = {}
+
+    def _make_plan(self, shape, dtype, axes, inverse):
+        return None
+
+    def _transform(self, a, axes, inverse, overwrite=False):
+        """
+        Returns the forward or inverse transform of a along axes. Every
+        backend implements this, those with in_place set may transform
+        a in place when overwrite is True.
+        """
+        raise NotImplementedError(type(self).__name__ + " does not implement _transform.")
+
+    def _store(self, result, out):
+        if out is None:
+            return result
+        if result is not out:
+            out[...] = result
+        return out
+
+    def _apply(self, a, out, axes, inverse):
+        a = np.asarray(a)
+        if not self.in_place or out is None or out.dtype != a.dtype or out.shape != a.shape:
+            return self._store(self._transform(a, axes, inverse), out)
+        # copy a into out and let the library transform it there
+        if out is not a:
+            out[...] = a
+        return self._store(self._transform(out, axes, inverse, overwrite=True), out)
+
+    def fft(self, a, out=None, axes=(-1,)):
+        """
+        Forward transform of a along axes, written into out if given.
+        """
+        return self._apply(a, out, tuple(axes), False)
+
+    def ifft(self, a, out=None, axes=(-1,)):
+        """
+        Inverse transform of a along axes, written into out if given.
+        """
+        return self._apply(a, out, tuple(axes), True)
+
+    def _real_transform(self, a, n, inverse):
+        if inverse:
+            return np.fft.irfft(a, n)
+        return np.fft.rfft(a)
+
+    def rfft(self, a, out=None):
+        """
+        Forward transform of the real array a along the last axis, the
+        n//2 + 1 non-negative frequencies are written into out if given.
+        """
+        return self._store(self._real_transform(a, None, False), out)
+
+    def irfft(self, a, n, out=None):
+        """
+        Inverse of rfft, returning the real array of length n along the
+        last axis, written into out if given.
+        """
+        return self._store(self._real_transform(a, n, True), out)
+
+    def _sine_transform(self, a):
+        # the FFT of the odd extension [0, a, 0, -a[::-1]]
+        a = np.asarray(a)
+        n = a.shape[-1]
+        extended = np.zeros(a.shape[:-1] + (2 * (n + 1),), dtype=np.result_type(a.dtype, 1j))
+        extended[..., 1:n + 1] = a
+        extended[..., n + 2:] = -a[..., ::-1]
+        result = 1j * self.fft(extended)[..., 1:n + 1]
+        if a.dtype.kind != "c":
+            return np.real(result)
+        return result
+
+    def dst(self, a, out=None):
+        """
+        Type I sine transform of a along the last axis,
+        y[k] = 2 sum_n a[n] sin(pi (k + 1) (n + 1)/(N + 1)), written into
+        out if given.
+        """
+        return self._store(self._sine_transform(a), out)
+
+    def idst(self, a, out=None):
+        """
+        Inverse of dst, written into out if given.
+        """
+        out = self._store(self._sine_transform(a), out)
+        out /= 2 * (np.shape(a)[-1] + 1)
+        return out
+
+    def _cosine_transform(self, a):
+        # the FFT of the even extension [a, a[-2:0:-1]]
+        a = np.asarray(a)
+        extended = np.concatenate((a, a[..., -2:0:-1]), axis=-1).astype(np.result_type(a.dtype, 1j))
+        result = self.fft(extended)[..., :a.shape[-1]]
+        if a.dtype.kind != "c":
+            return np.real(result)
+        return result
+
+    def dct(self, a, out=None):
+        """
+        Type I cosine transform of a along the last axis,
+        y[k] = a[0] + (-1)**k a[N - 1] + 2 sum_n a[n] cos(pi k n/(N - 1))
+        with the sum over 0 < n < N - 1, written into out if given.
+        """
+        return self._store(self._cosine_transform(a), out)
+
+    def idct(self, a, out=None):
+        """
+        Inverse of dct, written into out if given.
+        """
+        out = self._store(self._cosine_transform(a), out)
+        out /= 2 * (np.shape(a)[-1] - 1)
+        return out
+
+class SineBackend(object):
+    """
+    The type I sine transform of a backend presented through its fft,
+    ifft, rfft and irfft, for solvers with Dirichlet boundaries. The
+    transform is scaled so that sum(|fft(a)|**2) = N sum(|a|**2) as for
+    the FFT, and the real transforms return all N real coefficients.
+
+    Parameters
+    ----------
+    backend : FFTBackend
+        The backend computing the sine transforms
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.workers = backend.workers
+
+    def empty(self, shape, dtype=complex):
+        return self.backend.empty(shape, dtype)
+
+    def _scale(self, n):
+        return np.sqrt(0.5 * n / (n + 1))
+
+    def fft(self, a, out=None, axes=(-1,)):
+        assert tuple(axes) == (-1,)
+        out = self.backend.dst(a, out)
+        out *= self._scale(out.shape[-1])
+        return out
+
+    def ifft(self, a, out=None, axes=(-1,)):
+        assert tuple(axes) == (-1,)
+        out = self.backend.idst(a, out)
+        out /= self._scale(out.shape[-1])
+        return out
+
+    def rfft(self, a, out=None):
+        return self.fft(a, out)
+
+    def irfft(self, a, n, out=None):
+        return self.ifft(a, out)
+
+class CosineBackend(SineBackend):
+    """
+    The type I cosine transform of a backend presented through its fft,
+    ifft, rfft and irfft, for solvers with Neumann boundaries. The arrays
+    transformed carry the end points scaled by 1/sqrt(2), the weights of
+    the trapezoidal rule, in both x and p. The transform is then unitary
+    up to the FFT normalization sum(|fft(a)|**2) = N sum(|a|**2).
+
+    Parameters
+    ----------
+    backend : FFTBackend
+        The backend computing the cosine transforms
+    """
+    def _scale(self, n):
+        return np.sqrt(0.5 * n / (n - 1))
+
+    def _weights(self, a):
+        a = np.asarray(a)
+        weights = np.ones(a.shape[-1], dtype=a.real.dtype)
+        weights[[0, -1]] = np.sqrt(0.5)
+        return weights
+
+    def fft(self, a, out=None, axes=(-1,)):
+        assert tuple(axes) == (-1,)
+        weights = self._weights(a)
+        out = self.backend.dct(a / weights, out)
+        out *= weights * self._scale(out.shape[-1])
+        return out
+
+    def ifft(self, a, out=None, axes=(-1,)):
+        assert tuple(axes) == (-1,)
+        weights = self._weights(a)
+        out = self.backend.idct(a / weights, out)
+        out *= weights / self._scale(out.shape[-1])
+        return out
+
+class FFTPackBackend(FFTBackend):
+    name = "fftpack"
+    in_place = True
+
+    def _transform(self, a, axes, inverse, overwrite=False):
+        if len(axes) == 1:
+            if inverse:
+                return fftpack.ifft(a, axis=axes[0], overwrite_x=overwrite)
+            return fftpack.fft(a, axis=axes[0], overwrite_x=overwrite)
+        if inverse:
+            return fftpack.ifftn(a, axes=axes, overwrite_x=overwrite)
+        return fftpack.fftn(a, axes=axes, overwrite_x=overwrite)
+
+    def _sine_transform(self, a):
+        a = np.asarray(a)
+        if a.dtype.kind == "c":
+            return fftpack.dst(a.real, type=1) + 1j * fftpack.dst(a.imag, type=1)
+        return fftpack.dst(a, type=1)
+
+    def _cosine_transform(self, a):
+        a = np.asarray(a)
+        if a.dtype.kind == "c":
+            return fftpack.dct(a.real, type=1) + 1j * fftpack.dct(a.imag, type=1)
+        return fftpack.dct(a, type=1)
+
+class NumpyBackend(FFTBackend):
+    name = "numpy"
+
+    def _transform(self, a, axes, inverse):
+        if inverse:
+            return np.fft.ifftn(a, axes=axes)
+        return np.fft.fftn(a, axes=axes)
+
+class ScipyBackend(FFTBackend):
+    name = "scipy"
+
+    def __init__(self, workers=1):
+        if _scipy_fft is None:
+            raise ImportError("the scipy FFT backend requires scipy.fft "
+                              "(scipy >= 1.4).")
+        FFTBackend.__init__(self, workers)
+
+    in_place = True
+
+    def _transform(self, a, axes, inverse, overwrite=False):
+        if inverse:
+            return _scipy_fft.ifftn(a, axes=axes, overwrite_x=overwrite, workers=self.workers)
+        return _scipy_fft.fftn(a, axes=axes, overwrite_x=overwrite, workers=self.workers)
+
+    def _real_transform(self, a, n, inverse):
+        if inverse:
+            return _scipy_fft.irfft(a, n, workers=self.workers)
+        return _scipy_fft.rfft(a, workers=self.workers)
+
+    def _sine_transform(self, a):
+        return _scipy_fft.dst(a, type=1, workers=self.workers)
+
+    def _cosine_transform(self, a):
+        return _scipy_fft.dct(a, type=1, workers=self.workers)
+
+class FFTWBackend(FFTBackend):
+    """
+    Planned FFTs using pyfftw. A plan is built the first time a given
+    (shape, dtype, axes, direction) is transformed and then reused, the
+    result is written directly into out when it is given.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads used by each transform (default = 1)
+    planner_effort : string
+        The FFTW planner flag (default = "FFTW_MEASURE")
+    """
+    name = "fftw"
+
+    def __init__(self, workers=1, planner_effort="FFTW_MEASURE"):
+        if pyfftw is None:
+            raise ImportError("the fftw FFT backend requires pyfftw.")
+        FFTBackend.__init__(self, workers)
+        self.planner_effort = planner_effort
+
+    def empty(self, shape, dtype=complex):
+        return pyfftw.empty_aligned(shape, dtype=dtype)
+
+    def _make_plan(self, shape, dtype, axes, inverse):
+        direction = "FFTW_BACKWARD" if inverse else "FFTW_FORWARD"
+        return pyfftw.FFTW(self.empty(shape, dtype), self.empty(shape, dtype),
+                           axes=axes, direction=direction,
+                           flags=(self.planner_effort,),
+                           threads=self.workers)
+
+    def _execute(self, a, out, axes, inverse):
+        a = np.asarray(a)
+        if a.dtype.kind != "c":
+            a = a.astype(complex)
+        if out is not None and np.may_share_memory(a, out):
+            # the plans are out of place
+            a = a.copy()
+        plan = self.plan(a.shape, a.dtype, axes, inverse)
+        if out is None:
+            out = self.empty(a.shape, a.dtype)
+        return plan(input_array=a, output_array=out)
+
+    def fft(self, a, out=None, axes=(-1,)):
+        return self._execute(a, out, tuple(axes), False)
+
+    def ifft(self, a, out=None, axes=(-1,)):
+        return self._execute(a, out, tuple(axes), True)
+
+    def _real_plan(self, shape, dtype, n, inverse):
+        # real plans are keyed by the shape and dtype of the real array
+        key = ("real", tuple(shape), np.dtype(dtype), inverse)
+        try:
+            return self._plans[key]
+        except KeyError:
+            spectrum_shape = tuple(shape[:-1]) + (n // 2 + 1,)
+            real = self.empty(shape, dtype)
+            spectrum = self.empty(spectrum_shape, np.result_type(dtype, 1j))
+            if inverse:
+                plan = pyfftw.FFTW(spectrum, real, axes=(-1,), direction="FFTW_BACKWARD",
+                                   flags=(self.planner_effort,), threads=self.workers)
+            else:
+                plan = pyfftw.FFTW(real, spectrum, axes=(-1,), direction="FFTW_FORWARD",
+                                   flags=(self.planner_effort,), threads=self.workers)
+            self._plans[key] = plan
+            return plan
+
+    def rfft(self, a, out=None):
+        a = np.asarray(a)
+        if a.dtype.kind != "f":
+            a = a.astype(float)
+        plan = self._real_plan(a.shape, a.dtype, a.shape[-1], False)
+        if out is None:
+            out = self.empty(plan.output_shape, plan.output_dtype)
+        return plan(input_array=a, output_array=out)
+
+    def irfft(self, a, n, out=None):
+        a = np.asarray(a)
+        if a.dtype.kind != "c":
+            a = a.astype(complex)
+        shape = a.shape[:-1] + (n,)
+        plan = self._real_plan(shape, np.zeros(0, a.dtype).real.dtype, n, True)
+        if out is None:
+            out = self.empty(shape, plan.output_dtype)
+        return plan(input_array=a, output_array=out)
+
+_backends = {"fftpack":FFTPackBackend, "numpy":NumpyBackend,
+             "scipy":ScipyBackend, "fftw":FFTWBackend}
+
+def get_backend(backend=None, workers=1):
+    """
+    Returns an FFT backend.
+
+    Parameters
+    ----------
+    backend : string or FFTBackend, optional
+        Name of the backend, one of "fftpack", "numpy", "scipy" or
+        "fftw", or an FFTBackend instance which is returned unchanged.
+        (default = "fftpack")
+    workers : int, optional
+        Number of threads used by the backend when it is created
+        (default = 1)
+    """
+    if isinstance(backend, FFTBackend):
+        return backend
+    if backend is None:
+        backend = "fftpack"
+    try:
+        return _backends[backend](workers)
+    except KeyError:
+        raise ValueError("unknown FFT backend " + str(backend) + ".")
@@ -0,0 +1,142 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Splitting schemes for the split-operator time step of schrodinger.py.
+
+A scheme advances psi by one step dt as the product of potential and
+kinetic propagators
+
+    exp(-1j a[s] V dt) exp(-1j b[s-1] T dt) ... exp(-1j b[0] T dt) exp(-1j a[0] V dt)
+
+with len(a) = len(b) + 1. Every kinetic stage costs one forward and one
+inverse FFT, the potential stages are cheap and the last one of a step is
+merged with the first one of the next step. All schemes here are
+symmetric, so their order is even.
+
+Available schemes
+- "strang"      : second order Strang splitting, 1 stage
+- "yoshida4"    : fourth order triple jump of Strang, 3 stages
+- "suzuki4"     : fourth order five fold composition of Strang, 5 stages
+- "blanes_moan4": fourth order scheme S6 of Blanes and Moan, 6 stages
+- "yoshida6"    : sixth order triple jump of yoshida4, 9 stages
+
+The fourth and sixth order schemes take steps backwards in time, which
+is unstable in imaginary time, so imaginary time steps always use Strang.
+
+References
+- H. Yoshida, Phys. Lett. A 150, 262 (1990)
+- M. Suzuki, Phys. Lett. A 146, 319 (1990)
+- S. Blanes and P. C. Moan, J. Comput. Appl. Math. 142, 313 (2002)
+
+AUTHOR: Luke Siemens
+"""
+
+import numpy as np
+
+class Splitting(object):
+    """
+    A symmetric splitting scheme, with the coefficients a of the
+    potential stages and b of the kinetic stages.
+    """
+    def __init__(self, name, a, b, order):
+        self.name = name
+        self.a = np.asarray(a, dtype=float)
+        self.b = np.asarray(b, dtype=float)
+        self.order = order
+        assert len(self.a) == len(self.b) + 1
+        assert abs(np.sum(self.a) - 1) < 1e-12 and abs(np.sum(self.b) - 1) < 1e-12
+
+    @property
+    def stages(self):
+        """
+        The number of kinetic stages, and FFT pairs, per step.
+        """
+        return len(self.b)
+
+def compose(name, scheme, weights, order):
+    """
+    Returns the composition of scheme applied with the time steps
+    weights[0]*dt, weights[1]*dt, ... in turn.
+    """
+    a = [0.0]
+    b = []
+    for weight in weights:
+        a[-1] += weight * scheme.a[0]
+        a.extend(weight * scheme.a[1:])
+        b.extend(weight * scheme.b)
+    return Splitting(name, a, b, order)
+
+def _triple_jump(name, scheme):
+    power = 1.0 / (scheme.order + 1)
+    w1 = 1 / (2 - 2 ** power)
+    w0 = -2 ** power * w1
+    return compose(name, scheme, [w1, w0, w1], scheme.order + 2)
+
+strang = Splitting("strang", [0.5, 0.5], [1.0], 2)
+
+yoshida4 = _triple_jump("yoshida4", strang)
+
+yoshida6 = _triple_jump("yoshida6", yoshida4)
+
+_p = 1 / (4 - 4 ** (1.0 / 3))
+suzuki4 = compose("suzuki4", strang, [_p, _p, 1 - 4 * _p, _p, _p], 4)
+
+_a = [0.0792036964311957, 0.353172906049774, -0.0420650803577195]
+_b = [0.209515106613362, -0.143851773179818]
+_a.append(1 - 2 * sum(_a))
+_b.append(0.5 - sum(_b))
+blanes_moan4 = Splitting("blanes_moan4", _a + _a[-2::-1], _b + _b[::-1], 4)
+
+schemes = {"strang":strang, "yoshida4":yoshida4, "suzuki4":suzuki4,
+           "blanes_moan4":blanes_moan4, "yoshida6":yoshida6}
+
+def get_integrator(integrator=None):
+    """
+    Returns a splitting scheme.
+
+    Parameters
+    ----------
+    integrator : string or Splitting, optional
+        Name of the scheme, one of "strang", "yoshida4", "suzuki4",
+        "blanes_moan4" or "yoshida6", or a Splitting instance which is
+        returned unchanged (default = "strang")
+    """
+    if isinstance(integrator, Splitting):
+        return integrator
+    if integrator is None:
+        integrator = "strang"
+    try:
+        return schemes[integrator]
+    except KeyError:
+        raise ValueError("unknown integrator " + str(integrator) + ".")
@@ -0,0 +1,224 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Observables evaluated inside the time step loop of the Schrodinger
+solver.
+
+An observable is evaluated every few substeps on whichever
+representation of the wave function is already current, and its
+values are stored in arrays preallocated at the start of each call to
+time_step, or by evolve, which cannot count its steps in advance, in
+arrays whose capacity is doubled as they fill. Observables in "x" space see the state exactly at the end
+of a substep. Observables in "p" space are evaluated right after the
+kinetic multiply, on the state at the middle of the substep (their
+sample times are offset by dt/2). The expectation of p is exact to
+second order there, as the half potential kick shifts it by
+-<dV/dx> dt/2, which is its evolution over dt/2 by Ehrenfest's
+theorem. Observables in "both" spaces are evaluated at the same point
+and also see |psi_x|**2 at the start of the substep.
+
+AUTHOR: Luke Siemens
+"""
+
+import numpy as np
+
+class Observable(object):
+    """
+    A quantity recorded during time evolution.
+
+    Parameters
+    ----------
+    name : string
+        The name of the observable
+    func : callable
+        Function of psi_x (space "x"), psi_p (space "p") or
+        (psi_x, psi_p) (space "both") returning the value of the
+        observable. For an ensemble psi has shape (M, N).
+    space : string, optional
+        The representation the observable is evaluated in, "x", "p" or
+        "both" (default = "x")
+    every : int, optional
+        Number of substeps between evaluations (default = 1)
+    """
+    def __init__(self, name, func=None, space="x", every=1):
+        if space not in ("x", "p", "both"):
+            raise ValueError("unknown space " + str(space) + ".")
+        assert every >= 1
+        self.name = name
+        self.func = func
+        self.space = space
+        self.every = every
+        self.reset()
+
+    def reset(self):
+        self._chunks = []
+        self._pending = 0
+
+    def evaluate(self, solver, mod_x, mod_p):
+        """
+        Returns the value of the observable given the x and p-space
+        buffers of solver, only the buffer of the observable's space is
+        guaranteed to hold the state.
+        """
+        if self.space == "x":
+            return self.func(mod_x * solver._x_to_psi)
+        if self.space == "p":
+            return self.func(mod_p * solver._p_to_psi)
+        return self.func(mod_x * solver._x_to_psi, mod_p * solver._p_to_psi)
+
+    def _reserve(self, count):
+        self._pending = count
+        self._times = None
+        self._values = None
+        self._filled = 0
+
+    def _record(self, t, value):
+        if self._values is None:
+            value = np.asarray(value)
+            self._times = np.empty(self._pending, dtype=np.result_type(t, float))
+            self._values = np.empty((self._pending,) + value.shape, dtype=value.dtype)
+            self._chunks.append((self._times, self._values))
+        self._times[self._filled] = t
+        self._values[self._filled] = value
+        self._filled += 1
+
+    def _append(self, t, value):
+        """
+        Record a value when the number of samples is not known in
+        advance, after _reserve(0). The capacity of the chunk is doubled
+        whenever it is full, call _trim once the last value is recorded.
+        """
+        if self._values is None:
+            self._pending = max(self._pending, 16)
+        elif self._filled == len(self._times):
+            times = np.empty(2 * self._filled, dtype=self._times.dtype)
+            values = np.empty((2 * self._filled,) + self._values.shape[1:],
+                              dtype=self._values.dtype)
+            times[:self._filled] = self._times
+            values[:self._filled] = self._values
+            self._times, self._values = times, values
+            self._chunks[-1] = (times, values)
+        self._record(t, value)
+
+    def _trim(self):
+        """
+        Drop the unused capacity left in the chunk by _append.
+        """
+        if self._values is not None and self._filled < len(self._times):
+            self._times = self._times[:self._filled]
+            self._values = self._values[:self._filled]
+            self._chunks[-1] = (self._times, self._values)
+
+    @property
+    def times(self):
+        if not self._chunks:
+            return np.zeros(0)
+        return np.concatenate([times for times, values in self._chunks])
+
+    @property
+    def values(self):
+        if not self._chunks:
+            return np.zeros(0)
+        return np.concatenate([values for times, values in self._chunks])
+
+class _Builtin(Observable):
+    """
+    Observable computed directly from the FFT buffers, func is called
+    as func(solver, mod_x, mod_p).
+    """
+    def evaluate(self, solver, mod_x, mod_p):
+        return self.func(solver, mod_x, mod_p)
+
+def _weight(mod):
+    return np.real(np.conj(mod) * mod)
+
+def _mean(mod, f):
+    prob = _weight(mod)
+    return np.sum(f * prob, axis=-1) / np.sum(prob, axis=-1)
+
+def norm(every=1):
+    """
+    The norm <psi|psi>.
+    """
+    return _Builtin("norm", lambda S, mod_x, mod_p: 2 * np.pi / S.dx
+                    * np.sum(_weight(mod_x), axis=-1), "x", every)
+
+def position(every=1):
+    """
+    The expectation value <x>.
+    """
+    return _Builtin("x", lambda S, mod_x, mod_p: _mean(mod_x, S.x), "x", every)
+
+def potential(every=1):
+    """
+    The expectation value <V>.
+    """
+    return _Builtin("potential", lambda S, mod_x, mod_p: _mean(mod_x, S.potential()),
+                    "x", every)
+
+def momentum(every=1):
+    """
+    The expectation value <p>.
+    """
+    return _Builtin("p", lambda S, mod_x, mod_p: _mean(mod_p, S.p), "p", every)
+
+def kinetic(every=1):
+    """
+    The expectation value of the kinetic energy <p**2/(2 m)>.
+    """
+    return _Builtin("kinetic", lambda S, mod_x, mod_p: _mean(mod_p, S._kinetic()),
+                    "p", every)
+
+def energy(every=1):
+    """
+    The expectation value of the energy <p**2/(2 m)> + <V>. The kinetic
+    term is sampled dt/2 after the potential term, so the sum carries
+    an error of order dt.
+    """
+    return _Builtin("energy", lambda S, mod_x, mod_p: _mean(mod_p, S._kinetic())
+                    + _mean(mod_x, S.potential()), "both", every)
+
+def probability(a, b, name=None, every=1):
+    """
+    The probability of finding the particle in a <= x < b.
+    """
+    if name is None:
+        name = "P(" + str(a) + ", " + str(b) + ")"
+    def func(S, mod_x, mod_p):
+        region = (S.x >= a) & (S.x < b)
+        return 2 * np.pi / S.dx * np.sum(_weight(mod_x)[..., region], axis=-1)
+    return _Builtin(name, func, "x", every)
+
+builtins = {"norm":norm, "x":position, "potential":potential, "p":momentum,
+            "kinetic":kinetic, "energy":energy}
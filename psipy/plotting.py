@@ -92,25 +92,21 @@ import analytic
 import schrodinger
 
 dt = 10000
-N = 2**16
 M = 2**11
 dx = 1.0
-x = dx*(numpy.arange(N) - 0.5*N)
-
 x_lim = dx*M
 
+# the grid covers the inside of the well, the walls at +-x_lim are the
+# dirichlet boundaries of the solver
+x = dx*numpy.arange(1, 2*M) - x_lim
 V_x = numpy.zeros(x.shape)
-V_x[x < -x_lim] = 1E-5
-V_x[x > x_lim] = 1E-5
-V_x[x < -x_lim] = 1E100
-V_x[x > x_lim] = 1E100
 
 analytic = analytic.inf_square_well(x=x, m=1, dt=dt, L=2*x_lim)
 analytic.add_eigenstate([1, 2], [1, 1])
 
 psi_x0 = analytic.get_psi()
 
-numeric = schrodinger.Schrodinger(x=x, psi_x0=psi_x0, V_x=V_x, m=1)
+numeric = schrodinger.Schrodinger(x=x, psi_x0=psi_x0, V_x=V_x, m=1, boundary="dirichlet")
 
 def time_step():
     numeric.time_step(dt)
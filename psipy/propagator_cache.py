@@ -0,0 +1,119 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+A bounded least recently used cache for the propagator arrays of the
+split-operator solvers.
+
+AUTHOR: Luke Siemens
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+class PropagatorCache(object):
+    """
+    Least recently used cache of propagator arrays. Entries are evicted
+    oldest first once their total size exceeds max_bytes, the most
+    recently used entry is always kept. A single cache may be shared by
+    several solvers.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory budget of the cache in bytes (default = 64 MiB)
+    """
+    def __init__(self, max_bytes=64*2**20):
+        assert max_bytes >= 0
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, factory):
+        """
+        Returns the entry for key, calling factory() to compute it on a
+        cache miss.
+
+        Parameters
+        ----------
+        key : hashable
+            The key of the entry
+        factory : callable
+            Function of no arguments returning the array to be cached
+        """
+        try:
+            value = self._entries.pop(key)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            value = factory()
+            self.nbytes += np.asarray(value).nbytes
+        self._entries[key] = value
+        self._evict()
+        return value
+
+    def put(self, key, value):
+        """
+        Store value under key, replacing any existing entry.
+        """
+        if key in self._entries:
+            self.nbytes -= np.asarray(self._entries.pop(key)).nbytes
+        self._entries[key] = value
+        self.nbytes += np.asarray(value).nbytes
+        self._evict()
+
+    def clear(self):
+        self._entries = OrderedDict()
+        self.nbytes = 0
+
+    def stats(self):
+        """
+        Returns a dictionary of the hit and miss counters, the number of
+        entries and their total size in bytes.
+        """
+        return {"hits":self.hits, "misses":self.misses,
+                "entries":len(self._entries), "nbytes":self.nbytes}
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            key, value = self._entries.popitem(last=False)
+            self.nbytes -= np.asarray(value).nbytes
@@ -36,7 +36,8 @@ A numerical solver for the 2D time dependent schrodinger equation.
 """
 
 import numpy
-from scipy import fftpack as fft
+
+import fft_backend
 
 class psipy:
     """
@@ -46,7 +47,9 @@ class psipy:
 
     """
     
-    def __init__(self, x, psi_t0, V, k0):
-        pass
+    def __init__(self, x, psi_t0, V, k0, fft=None, workers=1):
+        # 2D transforms are taken over axes=(-2, -1) of the same backends
+        # used by the 1D solver
+        self._fft = fft_backend.get_backend(fft, workers)
     
    
@@ -0,0 +1,148 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Energy resolved transmission from a single wave packet propagation.
+
+A packet psi_0 incident from the left is a superposition of scattering
+states of energies E = p**2/(2 m) with amplitudes phi(p), its momentum
+space wave function. Downstream of the potential each scattering state
+is a transmitted plane wave, so the Fourier transform of the wave
+function at a detector x_d
+
+    A(E) = int exp(1j E t) psi(x_d, t) dt
+
+picks out the transmitted amplitude of the scattering state of energy E,
+and the transmission probability is
+
+    T(E) = |A(E)|**2 p p_d / (2 pi m**2 |phi(p)|**2)
+
+where p and p_d are the momenta of energy E at the packet and at the
+detector. A single broadband packet therefore gives T(E) over its whole
+energy band. The packet has to start to the left of the potential with
+only right moving components, and the run has to continue until the
+slowest transmitted components of interest have passed the detector.
+Absorbing boundaries (Schrodinger.set_absorber) downstream of the
+detector and upstream of the packet keep waves from coming back.
+
+AUTHOR: Luke Siemens
+"""
+
+import numpy as np
+
+import observables
+
+def detector(solver, x_detector, every=1, name="detector"):
+    """
+    Returns an observable recording the wave function psi(x_d, t) at the
+    grid point nearest x_detector, for Schrodinger.add_observable. The
+    value at the current time is recorded immediately.
+    """
+    j = np.argmin(np.abs(solver.x - x_detector))
+    def func(S, mod_x, mod_p):
+        return mod_x[..., j] * S._x_to_psi[j]
+    observable = observables._Builtin(name, func, "x", every)
+    observable._reserve(1)
+    observable._record(solver.t, func(solver, solver.psi_mod_x, None))
+    return observable
+
+class TransmissionAnalyzer(object):
+    """
+    Records the wave function at a detector downstream of the potential
+    during the propagation of a packet and returns the transmission
+    probability T(E) over the energy band of the packet.
+
+    Parameters
+    ----------
+    solver : Schrodinger
+        The solver, holding the incident packet
+    x_detector : float
+        The position of the detector, downstream of the potential
+    every : int, optional
+        Number of substeps between samples, the sampling interval has
+        to resolve the highest energy of interest (default = 1)
+    name : string, optional
+        The name of the detector observable (default = "detector")
+    """
+    def __init__(self, solver, x_detector, every=1, name="detector"):
+        psi_p = solver.psi_p
+        if psi_p.ndim != 1:
+            raise ValueError("TransmissionAnalyzer requires a single wave function.")
+        self.solver = solver
+        self.name = name
+        self.m = solver.m
+        self.p = np.copy(solver.p)
+        self.phi2 = np.abs(psi_p) ** 2
+        prob = np.abs(solver.psi_x) ** 2
+        V = np.real(solver.potential())
+        self.V_in = np.sum(V * prob) / np.sum(prob)
+        self.x_detector = solver.x[np.argmin(np.abs(solver.x - x_detector))]
+        self.V_detector = V[np.argmin(np.abs(solver.x - x_detector))]
+        solver.add_observable(detector(solver, x_detector, every, name))
+
+    def band(self, fraction=1e-3):
+        """
+        Returns the range of energies (E_min, E_max) where |phi(p)|**2
+        is above fraction times its maximum, outside of it T(E) is
+        dominated by noise.
+        """
+        p = self.p[self.phi2 > fraction * np.max(self.phi2)]
+        return self.V_in + p.min() ** 2 / (2 * self.m), self.V_in + p.max() ** 2 / (2 * self.m)
+
+    def amplitude(self, energies):
+        """
+        Returns the Fourier transform A(E) of the recorded detector signal.
+        """
+        times, values = self.solver.observable(self.name)
+        times = np.real(times)
+        weights = np.gradient(times)
+        weights[[0, -1]] *= 0.5
+        phases = np.exp(1j * np.outer(energies, times))
+        return np.dot(phases, weights * values)
+
+    def transmission(self, energies):
+        """
+        Returns the transmission probability at the given energies, which
+        should lie within band() and above the potential at the detector.
+
+        Parameters
+        ----------
+        energies : array_like
+            The energies
+        """
+        energies = np.asarray(energies, dtype=float)
+        p = np.sqrt(2 * self.m * (energies - self.V_in))
+        p_detector = np.sqrt(2 * self.m * np.maximum(energies - self.V_detector, 0))
+        phi2 = np.interp(p, self.p, self.phi2)
+        A2 = np.abs(self.amplitude(energies)) ** 2
+        return A2 * p * p_detector / (2 * np.pi * self.m ** 2 * phi2)
@@ -55,108 +55,657 @@ License: BSD style
 Please feel free to use and modify this, but keep the above information.
 """
 
+import itertools
+
 import numpy as np
-import numpy.ma as ma
-from scipy import fftpack
+from scipy import special
+from scipy.sparse import linalg as sparse_linalg
+
+import checkpoint
+import fft_backend
+import integrators
+import observables
+from propagator_cache import PropagatorCache
 
 import matplotlib.pyplot as pyplot
 
+def kinetic_key(tau, m, N, dx, dtype=complex, boundary="periodic"):
+    """
+    Returns the propagator cache key of the kinetic propagator
+    exp(-1j p**2 tau/(2 m)) on a grid of N points spaced by dx.
+    """
+    return ("p", tau, m, N, dx, np.dtype(dtype).str, boundary)
+
 class Schrodinger(object):
     """
     Class which implements a numerical solution of the time-dependent
     Schrodinger equation for an arbitrary potential
     """
-    def __init__(self, x, psi_x0, V_x, m=1):
+    # Each potential assigned to a solver gets a unique token, used in the
+    # keys of the propagator cache
+    _V_tokens = itertools.count()
+    # The largest (E - min(V_x)) tau of one imaginary time Chebyshev
+    # expansion, see chebyshev_step
+    chebyshev_limit = 10.0
+
+    def __init__(self, x, psi_x0, V_x, m=1, fft=None, workers=1, cache=None, dtype=complex, integrator=None, boundary="periodic"):
         """
         Parameters
         ----------
         x : array_like, float
             Length-N array of evenly spaced spatial coordinates
         psi_x0 : array_like, complex
-            Length-N array of the initial wave function at time t0
+            Length-N array of the initial wave function at time t0, or
+            an (M, N) array holding an ensemble of M wave functions
+            which are propagated together through the same potential
         V_x : array_like, float
             Length-N array giving the potential at each x
         m : float
             Particle mass (default = 1)
+        fft : string or fft_backend.FFTBackend, optional
+            The FFT backend used by the solver, see fft_backend.get_backend
+            (default = "fftpack")
+        workers : int, optional
+            Number of threads used by the FFT backend (default = 1)
+        cache : PropagatorCache or int, optional
+            Cache of the propagator arrays, which may be shared between
+            solvers, or the memory budget in bytes of a new cache
+            (default = a new 64 MiB cache)
+        dtype : numpy dtype, optional
+            complex128 (default) or complex64. The wave function buffers,
+            propagators and FFTs are all kept in this precision, see
+            precision_drift for the accuracy of complex64.
+        integrator : string or integrators.Splitting, optional
+            The splitting scheme of real time steps, see the integrators
+            module and compare_integrators (default = "strang")
+        boundary : string, optional
+            "periodic" (default) for the periodic grid of the FFT,
+            "dirichlet" for hard walls one grid spacing beyond each end
+            of x, or "neumann" for reflecting walls, where the
+            derivative vanishes, at x[0] and x[-1]. With walls the
+            kinetic term is applied with the type I sine or cosine
+            transform, so x only needs to cover the inside of the box.
+            psi_p then holds the amplitudes of the standing waves on the
+            momenta p >= 0 allowed by the walls, normalized as a density
+            in |p|. For Neumann walls the two end points carry half the
+            weight of the others in the norm and inner products, as for
+            the trapezoidal rule.
         """
         # Validation of array inputs
-        self.x, psi_x0, self.V_x = map(np.asarray, (x, psi_x0, V_x))
+        self.x, psi_x0, V_x = map(np.asarray, (x, psi_x0, V_x))
         N = self.x.size
         assert self.x.shape == (N,)
-        assert psi_x0.shape == (N,)
-        assert self.V_x.shape == (N,)
+        assert psi_x0.ndim in (1, 2) and psi_x0.shape[-1] == N
+        assert V_x.shape == (N,)
 
         # Validate and set internal parameters
+        self.dtype = np.dtype(dtype)
+        assert self.dtype in (np.complex64, np.complex128)
+        self._real_dtype = np.dtype(self.dtype.char.lower())
         assert m > 0
         self.m = m
+        if boundary not in ("periodic", "dirichlet", "neumann"):
+            raise ValueError("unknown boundary " + str(boundary) + ".")
+        self.boundary = boundary
+        self.integrator = integrators.get_integrator(integrator)
         self.t = 0.0
         self.dt_ = None
-        self.N = len(x)
-        self.dx = self.x[1] - self.x[0]
-        self.dp = 2 * np.pi / (self.N * self.dx)
+        self.steps = 0
         self._near_zero = 1e-10 #values below this are considered near zero
+        self._set_grid(self.x)
+
+        # FFT backend and the preallocated x and p-space buffers. _rep
+        # records which buffer holds the current state, "x", "p" or "both",
+        # the other one is only computed when it is read.
+        self._fft = fft_backend.get_backend(fft, workers)
+        if boundary == "dirichlet":
+            self._fft = fft_backend.SineBackend(self._fft)
+        elif boundary == "neumann":
+            self._fft = fft_backend.CosineBackend(self._fft)
+        self._mod_x = None
+        self._mod_p = None
+        self._rep = None
 
-        # Set momentum scale
-        self.p0 = -np.pi/self.dx
-        self.p = self.p0 + self.dp * np.arange(self.N)
-        
         self.psi_x = psi_x0
-        self.compute_p_from_x()
 
-        # Variables which hold steps in evolution
+        # Variables which hold steps in evolution, looked up in the
+        # propagator cache whenever dt, V_x or m change
+        if isinstance(cache, PropagatorCache):
+            self.cache = cache
+        elif cache is None:
+            self.cache = PropagatorCache()
+        else:
+            self.cache = PropagatorCache(cache)
+        self._propagator_key = None
         self.x_evolve_half = None
         self.x_evolve = None
         self.p_evolve = None
+        self.absorber = None
+        self.absorbed = 0.0
+        self.V_x = V_x
+
+        # Observables evaluated during time_step, by name
+        self.observables = {}
+        # Statistics of the last adaptive run, see evolve
+        self.step_stats = None
+
+        # Eigenstates, energies and projector of set_eigenbasis
+        self._eigenbasis = None
+
+        # Potential function, margin, check interval and grid of the
+        # co-moving window
+        self._V_func = None
+        self._window_margin = None
+        self._window_every = None
+        self._window_grid = None
+
+        # Time dependent part of the potential, see set_drive
+        self._drive_V = None
+        self._drive_f = None
+        self._drive_V1 = None
+
+    def _set_grid(self, x, dx=None):
+        """
+        Set the spatial grid, with spacing dx (default = x[1] - x[0]),
+        and the momentum grid and phase factors which depend on it. The
+        eigenbasis of set_eigenbasis belongs to the old grid and is
+        removed.
+        """
+        self._eigenbasis = None
+        self.x = x
+        self.N = len(x)
+        self.dx = self.x[1] - self.x[0] if dx is None else dx
+        # quadrature weights of the grid points in units of dx
+        self._weights = np.ones(self.N)
+        if self.boundary != "periodic":
+            # standing waves between walls at x[0] - dx and x[-1] + dx
+            # (dirichlet) or at x[0] and x[-1] (neumann)
+            if self.boundary == "dirichlet":
+                L, k = (self.N + 1) * self.dx, np.arange(1, self.N + 1)
+            else:
+                L, k = (self.N - 1) * self.dx, np.arange(self.N)
+            self.dp = np.pi / L
+            self.p0 = self.dp * k[0]
+            self.p = self.dp * k
+            x_to_psi = np.sqrt(2 * np.pi) / self.dx * np.ones(self.N)
+            p_to_psi = np.sqrt(2 * L / (self.N * self.dx)) * np.ones(self.N)
+            if self.boundary == "neumann":
+                # the cosine transform acts on the end points scaled by
+                # the square root of their weight, in x and in p
+                self._weights[[0, -1]] = 0.5
+                x_to_psi /= np.sqrt(self._weights)
+                p_to_psi /= np.sqrt(self._weights)
+            self._x_to_psi = x_to_psi.astype(self.dtype)
+            self._psi_to_x = (1 / x_to_psi).astype(self.dtype)
+            self._p_to_psi = p_to_psi.astype(self.dtype)
+            self._psi_to_p = (1 / p_to_psi).astype(self.dtype)
+            return
+        self.dp = 2 * np.pi / (self.N * self.dx)
+
+        # Set momentum scale
+        self.p0 = -np.pi/self.dx
+        self.p = self.p0 + self.dp * np.arange(self.N)
+
+        # Phase factors relating psi_x, psi_p to the FFT representation
+        x_to_psi = np.exp(1j * self.p0 * self.x) * np.sqrt(2 * np.pi) / self.dx
+        p_to_psi = np.exp(-1j * self.x[0] * self.dp * np.arange(self.N))
+        self._x_to_psi = x_to_psi.astype(self.dtype)
+        self._psi_to_x = (1 / x_to_psi).astype(self.dtype)
+        self._p_to_psi = p_to_psi.astype(self.dtype)
+        self._psi_to_p = (1 / p_to_psi).astype(self.dtype)
 
     def _set_psi_x(self, psi_x, normalize=True):
-        assert psi_x.shape == self.x.shape
-        self.psi_mod_x = (psi_x * np.exp(-1j * self.p[0] * self.x)
-                          * self.dx / np.sqrt(2 * np.pi))
+        psi_x = np.asarray(psi_x)
+        assert psi_x.ndim in (1, 2) and psi_x.shape[-1] == self.N
+        self._allocate(psi_x.shape)
+        np.multiply(psi_x, self._psi_to_x, out=self._mod_x)
+        self._rep = "x"
         if normalize:
             self.normalize()
-        self.compute_p_from_x()
 
     def _get_psi_x(self):
-        return (self.psi_mod_x * np.exp(1j * self.p[0] * self.x)
-                * np.sqrt(2 * np.pi) / self.dx)
+        return self.psi_mod_x * self._x_to_psi
 
     def _set_psi_p(self, psi_p, normalize=True):
-        assert psi_p.shape == self.x.shape
-        self.psi_mod_p = psi_p * np.exp(1j * self.x[0] * self.dp
-                                        * np.arange(self.N))
-        self.compute_x_from_p()
+        psi_p = np.asarray(psi_p)
+        assert psi_p.ndim in (1, 2) and psi_p.shape[-1] == self.N
+        self._allocate(psi_p.shape)
+        np.multiply(psi_p, self._psi_to_p, out=self._mod_p)
+        self._rep = "p"
         if normalize:
             self.normalize()
 
     def _get_psi_p(self):
-        return self.psi_mod_p * np.exp(-1j * self.x[0] * self.dp
-                                        * np.arange(self.N))
+        return self.psi_mod_p * self._p_to_psi
+
+    def _get_psi_mod_x(self):
+        if self._rep == "p":
+            self.compute_x_from_p()
+        return self._mod_x
+
+    def _set_psi_mod_x(self, psi_mod_x):
+        self._allocate(np.shape(psi_mod_x))
+        self._mod_x[...] = psi_mod_x
+        self._rep = "x"
+
+    def _get_psi_mod_p(self):
+        if self._rep == "x":
+            self.compute_p_from_x()
+        return self._mod_p
+
+    def _set_psi_mod_p(self, psi_mod_p):
+        self._allocate(np.shape(psi_mod_p))
+        self._mod_p[...] = psi_mod_p
+        self._rep = "p"
 
     def _get_dt(self):
         return self.dt_
 
     def _set_dt(self, dt):
         assert dt != 0
-        if dt != self.dt_:
-            self.dt_ = dt
-            self.x_evolve_half = np.exp(-0.5 * 1j * self.V_x * self.dt)
-            self.x_evolve = self.x_evolve_half ** 2
-            self.p_evolve = np.exp(-0.5 * 1j * (self.p ** 2) * self.dt
-                                    / (self.m))
+        self.dt_ = dt
+        key = (dt, self._V_token, self.m)
+        if key != self._propagator_key:
+            self._propagator_key = key
+            self.x_evolve_half = self._x_factor(0.5 * dt)
+            self.x_evolve = self.cache.get(("x", dt, self._V_token),
+                                           lambda: self.x_evolve_half ** 2)
+            self.p_evolve = self._p_factor(dt)
+
+    def _get_V_x(self):
+        return self.V_x_
+
+    def _set_V_x(self, V_x):
+        V_x = np.asarray(V_x)
+        assert V_x.shape == (self.N,)
+        self.V_x_ = V_x
+        self._V_token = next(Schrodinger._V_tokens)
+        self._propagator_key = None
+        if self.dt_ is not None:
+            self.dt = self.dt_
+
+    def set_absorber(self, width, strength=None, power=2):
+        """
+        Line both edges of the grid with a complex absorbing potential
+        -1j W(x), which removes the parts of the wave function that reach
+        the edges instead of letting them wrap around the periodic domain.
+        Across each layer W rises from zero to strength as
+        (depth/width)**power. The absorber is folded into the potential
+        propagators of real time steps, imaginary time steps are not
+        affected. While it is set time_step does not normalize real time
+        steps, and the norm removed is accumulated in self.absorbed as
+        the flux out of the domain.
+
+        Reflection from the layer is small once it is several de Broglie
+        wavelengths wide and strength*width/v is large compared to one,
+        where v is the speed of the outgoing packet. Too large a strength
+        reflects from the inner edge of the layer, larger powers give a
+        smoother onset.
+
+        Parameters
+        ----------
+        width : float
+            Width of each absorbing layer, or None to remove the absorber
+        strength : float
+            The maximum of W at the edges of the grid
+        power : float, optional
+            Exponent of the profile of W, 2 for a quadratic ramp
+            (default = 2)
+        """
+        if width is None:
+            self.absorber = None
+        else:
+            assert 0 < width < 0.5 * (self.x[-1] - self.x[0]) and strength > 0
+            depth = np.maximum(np.maximum(self.x[0] + width - self.x,
+                                          self.x - (self.x[-1] - width)), 0)
+            self.absorber = strength * (depth / width) ** power
+        self.absorbed = 0.0
+        self._V_token = next(Schrodinger._V_tokens)
+        self._propagator_key = None
+        if self.dt_ is not None:
+            self.dt = self.dt_
+
+    def set_window(self, V, margin=0.1, every=100):
+        """
+        Make the grid a window which follows the wave function. Every
+        few substeps of real time propagation, and at the end of every
+        call of time_step, once the centroid of the probability
+        density (summed over the rows of an ensemble) is more than
+        margin times the width of the window away from its centre, the
+        window is moved by a whole number of grid cells to recentre it
+        and V_x is resampled from V over the new window. The part of the
+        wave function left behind by the window is discarded and added
+        to self.absorbed, an absorber (see set_absorber) moves with the
+        window and keeps the trailing edge clean.
+
+        The window is a property of the run, it is not saved by
+        save_checkpoint and has to be set again after load_checkpoint.
+        A separable drive V1 of set_drive is only known on the grid, so
+        it cannot follow the window, give a drive as V(x, t) instead.
+
+        Parameters
+        ----------
+        V : callable
+            Function returning the potential at an array of positions,
+            or None to fix the grid
+        margin : float, optional
+            Offset of the centroid, as a fraction of the width of the
+            window, which triggers a move (default = 0.1)
+        every : int, optional
+            Number of substeps between checks of the centroid, small
+            enough that the wave function does not cross the margin and
+            reach the edge of the window in between (default = 100)
+        """
+        if V is None:
+            self._V_func = None
+            self._window_margin = None
+            self._window_every = None
+            self._window_grid = None
+            return
+        if self.boundary != "periodic":
+            raise ValueError("a moving window requires a periodic boundary.")
+        if self._drive_V1 is not None:
+            raise ValueError("a moving window requires the drive as V(x, t), "
+                             "not the separable V1 and f.")
+        assert 0 <= margin < 0.5 and every >= 1
+        self._V_func = V
+        self._window_margin = margin
+        self._window_every = every
+        # the window is x[0] + dx*(cells + arange(N)) for the x[0] and dx
+        # of this grid and a whole number of cells moved
+        self._window_grid = (self.x[0], self.dx, 0)
+        self.V_x = V(self.x)
+
+    def _follow(self):
+        """
+        Move the window of set_window onto the centroid of the wave
+        function. The window is shifted by whole grid cells, so psi_mod_x
+        is only shifted and the kinetic propagator is unchanged. The grid
+        is rebuilt from the cells moved so far, which keeps dx exact.
+        """
+        mod_x = self.psi_mod_x
+        prob = np.real(np.conj(mod_x) * mod_x)
+        if prob.ndim == 2:
+            prob = np.sum(prob, axis=0)
+        centroid = np.sum(self.x * prob) / np.sum(prob)
+        offset = centroid - 0.5 * (self.x[0] + self.x[-1])
+        shift = int(np.round(offset / self.dx))
+        if abs(offset) <= self._window_margin * self.N * self.dx or shift == 0:
+            return
+        norm2 = self._norm2()
+        mod_x[...] = np.roll(mod_x, -shift, axis=-1)
+        if shift > 0:
+            mod_x[..., -shift:] = 0
+        else:
+            mod_x[..., :-shift] = 0
+        self._rep = "x"
+        x0, dx, cells = self._window_grid
+        cells += shift
+        self._window_grid = (x0, dx, cells)
+        self._set_grid(x0 + dx * (cells + np.arange(self.N)), dx)
+        lost = np.squeeze(norm2 - self._norm2())
+        self.absorbed = self.absorbed + (lost if lost.ndim else lost[()])
+        self.V_x = self._V_func(self.x)
+
+    def regrid(self, N=None, dx=None, V_x=None):
+        """
+        Resample the current state onto a new grid of N points spaced by
+        dx, centred on the current grid. The extent is changed first by
+        padding the wave function with zeros or cropping it in x, then
+        the spacing by zero-padding (refining) or truncating (coarsening)
+        psi_p, so the momentum grids of the old and new grids coincide.
+        This requires N*dx to be a whole multiple of the current dx, with
+        the same parity as N. The p grid and the propagators are rebuilt,
+        norm cropped away is added to self.absorbed.
+
+        Parameters
+        ----------
+        N : int, optional
+            The number of points of the new grid (default = self.N)
+        dx : float, optional
+            The spacing of the new grid (default = self.dx)
+        V_x : callable or array_like, optional
+            The potential on the new grid, or a function returning it at
+            an array of positions. By default the function of set_window
+            is used, or else V_x is interpolated linearly from the old
+            grid and extended by its end values. The V1 of a separable
+            drive (see set_drive) is always interpolated in this way.
+        """
+        if self.boundary != "periodic":
+            raise ValueError("regrid requires a periodic boundary.")
+        N = self.N if N is None else int(N)
+        dx = self.dx if dx is None else dx
+        N_x = int(np.round(N * dx / self.dx))
+        if abs(N_x * self.dx - N * dx) > 1e-9 * N * dx or (N_x - N) % 2 != 0:
+            raise ValueError("the extent N*dx must be a multiple of the current dx, "
+                             "with the same parity as N.")
+
+        old_x = self.x
+        old_V_x = self.V_x
+        norm2 = self._norm2()
+
+        # pad or crop in x, keeping the grid centred
+        pad = (N_x - self.N) // 2
+        psi_x = self.psi_x
+        new_psi_x = np.zeros(psi_x.shape[:-1] + (N_x,), dtype=self.dtype)
+        if pad >= 0:
+            new_psi_x[..., pad:pad + self.N] = psi_x
+        else:
+            new_psi_x[...] = psi_x[..., -pad:-pad + N_x]
+        self._set_grid(self.x[0] + self.dx * (np.arange(N_x) - pad), self.dx)
+        self._set_psi_x(new_psi_x, normalize=False)
+
+        # zero-pad or truncate psi_p, the two p grids are offset by a
+        # whole number of points
+        if N != N_x:
+            psi_p = self.psi_p
+            new_psi_p = np.zeros(psi_p.shape[:-1] + (N,), dtype=self.dtype)
+            offset = (N_x - N) // 2
+            if offset >= 0:
+                new_psi_p[...] = psi_p[..., offset:offset + N]
+            else:
+                new_psi_p[..., -offset:-offset + N_x] = psi_p
+            self._set_grid(self.x[0] + dx * np.arange(N), dx)
+            self._set_psi_p(new_psi_p, normalize=False)
+
+        lost = np.squeeze(norm2 - self._norm2())
+        self.absorbed = self.absorbed + (lost if lost.ndim else lost[()])
+        if self.absorber is not None:
+            self.absorber = np.interp(self.x, old_x, self.absorber)
+        if self._V_func is not None:
+            self._window_grid = (self.x[0], self.dx, 0)
+        if V_x is None and self._V_func is not None:
+            V_x = self._V_func
+        if V_x is None:
+            V_x = np.interp(self.x, old_x, old_V_x)
+        elif callable(V_x):
+            V_x = V_x(self.x)
+        self.V_x = V_x
+        if self._drive_V1 is not None:
+            self._drive_V1 = np.interp(self.x, old_x, self._drive_V1)
+
+    def spectral_tail(self, fraction=0.1):
+        """
+        Returns the fraction of the norm in the outer fraction of the
+        momentum band on each side, |p| > (1 - fraction)*pi/dx, the
+        largest value over the rows of an ensemble.
+        """
+        prob = np.abs(self.psi_mod_p) ** 2
+        tail = np.abs(self.p) > (1 - fraction) * np.pi / self.dx
+        return np.max(np.sum(prob[..., tail], axis=-1) / np.sum(prob, axis=-1))
+
+    def auto_regrid(self, refine_tol=1e-8, coarsen_tol=1e-12, fraction=0.1):
+        """
+        Refine or coarsen the grid by a factor of two at fixed extent,
+        depending on the spectral tail of the wave function. The grid is
+        refined while spectral_tail(fraction) is above refine_tol, and
+        coarsened if the norm outside the band of the coarser grid, down
+        to its own tail, is below coarsen_tol. Call it between time
+        steps, for example in a loop over run. Returns the factor by
+        which dx was changed.
+
+        Parameters
+        ----------
+        refine_tol : float, optional
+            The tail norm above which the grid is refined (default = 1e-8)
+        coarsen_tol : float, optional
+            The norm near and beyond the band edge of the coarser grid
+            below which the grid is coarsened, smaller than refine_tol
+            (default = 1e-12)
+        fraction : float, optional
+            The width of the tail as a fraction of the band (default = 0.1)
+        """
+        assert coarsen_tol < refine_tol and 0 < fraction < 1
+        if self.N % 2 == 0 and self.spectral_tail(fraction) > refine_tol:
+            self.regrid(2 * self.N, 0.5 * self.dx)
+            return 0.5
+        if self.N % 4 == 0 and self.spectral_tail(0.5 + 0.5 * fraction) < coarsen_tol:
+            self.regrid(self.N // 2, 2 * self.dx)
+            return 2.0
+        return 1.0
+
+    def _potential_factor(self, V_x, tau):
+        """
+        Returns the potential propagator exp(-1j V_x tau), including the
+        absorber exp(-W tau) for real tau.
+        """
+        exponent = -1j * V_x * tau
+        if self.absorber is not None and np.isreal(tau):
+            exponent = exponent - self.absorber * np.real(tau)
+        return np.exp(exponent).astype(self.dtype)
+
+    def _x_factor(self, tau):
+        """
+        Returns the cached propagator of the static potential V_x.
+        """
+        return self.cache.get(("x", tau, self._V_token),
+                              lambda: self._potential_factor(self.V_x, tau))
+
+    def set_drive(self, V1=None, f=None, V=None):
+        """
+        Make the potential time dependent, either separable as
+        V_x + f(t) V1 or a general function V(x, t). Real time steps then
+        apply the potential at the time of each potential stage of the
+        splitting scheme, with the time advanced by the kinetic stages,
+        which keeps the order of the scheme. For the separable form the
+        cached propagators of V_x are multiplied by exp(-1j f(t) V1 tau),
+        a general V is evaluated over the whole grid at every stage.
+        Imaginary time steps, chebyshev_step, energy and all of the
+        eigensolvers use the potential frozen at the real part of the
+        current time, which imaginary time steps leave unchanged.
+
+        Called without arguments the drive is removed. Like the window
+        the drive is not saved by save_checkpoint. regrid interpolates V1
+        onto the new grid, a moving window (see set_window) requires the
+        general form V.
+
+        Parameters
+        ----------
+        V1 : array_like, optional
+            Length-N array of the driven part of a separable potential
+        f : callable, optional
+            The driving function f(t) of a separable potential
+        V : callable, optional
+            A general potential, returning its values at the array of
+            positions x at time t as V(x, t)
+        """
+        if V is not None:
+            assert V1 is None and f is None
+        elif V1 is not None:
+            assert f is not None
+            V1 = np.asarray(V1)
+            assert V1.shape == (self.N,)
+            if self._V_func is not None:
+                raise ValueError("a moving window requires the drive as V(x, t), "
+                                 "not the separable V1 and f.")
+        self._drive_V = V
+        self._drive_f = f
+        self._drive_V1 = V1
+
+    def potential(self, t=None):
+        """
+        Returns the potential at time t (default = the real part of
+        self.t), V_x plus any time dependent part set by set_drive.
+        """
+        if t is None:
+            t = np.real(self.t)
+        if self._drive_V is not None:
+            return np.asarray(self._drive_V(self.x, t))
+        if self._drive_V1 is not None:
+            return self.V_x + self._drive_f(t) * self._drive_V1
+        return self.V_x
+
+    def _driven_factor(self, tau, t):
+        """
+        Returns the propagator exp(-1j V(x, t) tau) of the potential of
+        set_drive.
+        """
+        if self._drive_V is not None:
+            return self._potential_factor(np.asarray(self._drive_V(self.x, t)), tau)
+        factor = np.exp((-1j * tau * self._drive_f(t)) * self._drive_V1)
+        factor *= self._x_factor(tau)
+        return factor.astype(self.dtype, copy=False)
+
+    def _kinetic(self):
+        """
+        Returns the cached kinetic energy p**2/(2 m) on the p grid.
+        """
+        key = ("T", self.m, self.N, self.dx, self._real_dtype.str, self.boundary)
+        return self.cache.get(key, lambda: (0.5 * self.p ** 2 / self.m).astype(self._real_dtype))
+
+    def _p_factor(self, tau):
+        """
+        Returns the cached kinetic propagator exp(-1j p**2 tau/(2 m)).
+        """
+        key = kinetic_key(tau, self.m, self.N, self.dx, self.dtype, self.boundary)
+        return self.cache.get(key, lambda: np.exp(-0.5 * 1j * (self.p ** 2)
+                                                  * tau / self.m).astype(self.dtype))
+
+    def _norm2(self):
+        """
+        Returns the squared norm of the wave function (of each row of an
+        ensemble, with a trailing axis of length one) from whichever
+        representation is current, by Parseval's theorem
+        sum(|psi_mod_x|**2) = sum(|psi_mod_p|**2)/N.
+        """
+        if self._rep == "p":
+            norm2 = np.sum(np.real(np.conj(self._mod_p)*self._mod_p),
+                           axis=-1, keepdims=True) / self.N
+        else:
+            norm2 = np.sum(np.real(np.conj(self._mod_x)*self._mod_x),
+                           axis=-1, keepdims=True)
+        return 2 * np.pi * norm2 / self.dx
 
     def normalize(self):
-        self.psi_mod_x *= self.wf_norm(self.psi_x)
-        self.compute_p_from_x()
+        """
+        Normalize the wave function (each row of an ensemble) using
+        whichever representation is current.
+        """
+        scale = (1 / np.sqrt(self._norm2())).astype(self._real_dtype)
+        if self._rep != "p":
+            self._mod_x *= scale
+        if self._rep != "x":
+            self._mod_p *= scale
 
     psi_x = property(_get_psi_x, _set_psi_x)
     psi_p = property(_get_psi_p, _set_psi_p)
+    psi_mod_x = property(_get_psi_mod_x, _set_psi_mod_x)
+    psi_mod_p = property(_get_psi_mod_p, _set_psi_mod_p)
     dt = property(_get_dt, _set_dt)
+    V_x = property(_get_V_x, _set_V_x)
+
+    def _allocate(self, shape):
+        if self._mod_x is None or self._mod_x.shape != shape:
+            self._mod_x = self._fft.empty(shape, self.dtype)
+            self._mod_p = self._fft.empty(shape, self.dtype)
 
     def compute_p_from_x(self):
-        self.psi_mod_p = fftpack.fft(self.psi_mod_x)
+        self._fft.fft(self._mod_x, out=self._mod_p)
+        self._rep = "both"
 
     def compute_x_from_p(self):
-        self.psi_mod_x = fftpack.ifft(self.psi_mod_p)
+        self._fft.ifft(self._mod_p, out=self._mod_x)
+        self._rep = "both"
 
     def wf_norm(self, wave_fn):
         """
@@ -165,80 +714,1042 @@ class Schrodinger(object):
         Parameters
         ----------
         wave_fn : array
-            Length-N array of the wavefunction in the position representation
+            Length-N array of the wavefunction in the position
+            representation, or an (M, N) ensemble. For an ensemble an
+            (M, 1) array holding the norm of each row is returned.
+        """
+        assert wave_fn.ndim in (1, 2) and wave_fn.shape[-1] == self.N
+        prob = np.real(np.conj(wave_fn)*wave_fn)
+        if self.boundary == "neumann":
+            prob = prob * self._weights.astype(prob.dtype)
+        norm = prob.dtype.type(1)/np.sqrt(prob.dtype.type(self.dx)*np.sum(prob, axis=-1))
+        if wave_fn.ndim == 2:
+            norm = norm[:, np.newaxis]
+        return norm
+
+    def apply_hamiltonian(self, psi_x):
+        """
+        Returns H psi_x, with the kinetic term applied in p-space and the
+        potential term in x-space.
+
+        Parameters
+        ----------
+        psi_x : array
+            Length-N array of the wavefunction in the position
+            representation, or an (M, N) ensemble
+        """
+        mod_x = np.asarray(psi_x) * self._psi_to_x
+        mod_p = self._fft.fft(mod_x)
+        mod_p *= self._kinetic()
+        H_mod_x = self._fft.ifft(mod_p)
+        H_mod_x += self.potential() * mod_x
+        return H_mod_x * self._x_to_psi
+
+    def hamiltonian_operator(self):
+        """
+        Returns H as a scipy.sparse.linalg.LinearOperator acting on
+        length-N arrays. H is applied matrix free by apply_hamiltonian.
+        With Neumann walls H is only hermitian under the weighted inner
+        product of the grid, so the operator acts on sqrt(w)*psi_x for
+        the weights w, 0.5 at the end points and 1 elsewhere, as in
+        lanczos_eigenstates. Its eigenvectors are then divided by
+        sqrt(w) to give wave functions.
+        """
+        root_weights = np.sqrt(self._weights)
+        matvec = lambda v: self.apply_hamiltonian(np.ravel(v) / root_weights) * root_weights
+        return sparse_linalg.LinearOperator((self.N, self.N), matvec=matvec,
+                                            rmatvec=matvec, dtype=self.dtype)
+
+    def _to_real(self, psi_x):
+        """
+        Returns the wave function (each row of an ensemble) rotated by a
+        constant phase to be real, the real part of the result.
+        """
+        psi_x = np.asarray(psi_x)
+        if not np.iscomplexobj(psi_x):
+            return psi_x.astype(self._real_dtype)
+        phase = np.exp(-0.5j * np.angle(np.sum(psi_x ** 2, axis=-1)))
+        return np.real(psi_x * np.asarray(phase)[..., np.newaxis]).astype(self._real_dtype)
+
+    def _real_kinetic(self):
+        """
+        Returns the cached kinetic energy on the non-negative frequencies
+        of a real FFT, or on the p grid for walls.
+        """
+        if self.boundary != "periodic":
+            return self._kinetic()
+        key = ("Tr", self.m, self.N, self.dx, self._real_dtype.str)
+        return self.cache.get(key, lambda: (0.5 * (2 * np.pi * np.fft.rfftfreq(self.N, self.dx)) ** 2
+                                            / self.m).astype(self._real_dtype))
+
+    def _real_time_step(self, psi_x, dtau, Nsteps):
+        """
+        Imaginary time Strang steps of the real wave function psi_x (each
+        row of an ensemble), in place, with real FFTs and the real
+        factors exp(-V dtau) and exp(-p**2 dtau/(2 m)), for the potential
+        V frozen at the current time.
+        """
+        V_x = self.potential()
+        if np.iscomplexobj(V_x):
+            raise ValueError("the real mode requires a real potential.")
+        real = self._real_dtype
+        if self._drive_V is not None or self._drive_V1 is not None:
+            x_half = np.exp(-0.5 * dtau * V_x).astype(real)
+            x_full = x_half ** 2
+        else:
+            x_half = self.cache.get(("xr", 0.5 * dtau, self._V_token),
+                                    lambda: np.exp(-0.5 * dtau * V_x).astype(real))
+            x_full = self.cache.get(("xr", dtau, self._V_token), lambda: x_half ** 2)
+        p_factor = self.cache.get(("pr", dtau, self.m, self.N, self.dx, real.str, self.boundary),
+                                  lambda: np.exp(-dtau * self._real_kinetic()).astype(real))
+        if self.boundary != "periodic":
+            psi_k = self._fft.empty(psi_x.shape, real)
+        else:
+            psi_k = self._fft.empty(psi_x.shape[:-1] + (self.N // 2 + 1,), self.dtype)
+        root_weights = np.sqrt(self._weights).astype(real)
+        if self.boundary == "neumann":
+            psi_x *= root_weights
+        psi_x *= x_half
+        for num_iter in xrange(Nsteps):
+            self._fft.rfft(psi_x, out=psi_k)
+            psi_k *= p_factor
+            self._fft.irfft(psi_k, self.N, out=psi_x)
+            psi_x *= x_full if num_iter < Nsteps - 1 else x_half
+        if self.boundary == "neumann":
+            psi_x /= root_weights
+        return psi_x
+
+    def _real_hamiltonian(self, psi_x):
+        """
+        Returns H psi_x for a real wave function, using real FFTs.
+        """
+        root_weights = np.sqrt(self._weights).astype(self._real_dtype)
+        H_psi_x = self._fft.irfft(self._fft.rfft(psi_x * root_weights) * self._real_kinetic(), self.N)
+        H_psi_x /= root_weights
+        H_psi_x += np.real(self.potential()) * psi_x
+        return H_psi_x
+
+    def lanczos_eigenstates(self, k, sigma=None, tol=0, maxiter=None, solver_tol=1e-10):
+        """
+        Find k eigenstates of H with the implicitly restarted Lanczos
+        method (ARPACK eigsh) applied to the matrix free hamiltonian.
+        Without sigma the k lowest states are found. With sigma the k
+        states with energy nearest sigma are found by shift-invert,
+        where (H - sigma)^-1 is applied by MINRES.
+
+        The lowest states of a potential with very large walls (such as
+        V_x = 1E30) are poorly separated relative to the norm of H, for
+        such potentials give sigma close to the energies of interest. The
+        residual norms are then dominated by the roundoff left inside
+        the walls and overestimate the error in the energies.
+
+        Parameters
+        ----------
+        k : int
+            The number of eigenstates to find
+        sigma : float, optional
+            Find the states with energies nearest sigma (default = None)
+        tol : float, optional
+            Relative accuracy of the eigenvalues, 0 is machine precision
+            (default = 0)
+        maxiter : int, optional
+            Maximum number of Arnoldi update iterations (default = None)
+        solver_tol : float, optional
+            Relative tolerance of the MINRES solves used for shift-invert
+            (default = 1e-10)
+
+        Returns
+        -------
+        eigenstates : array
+            (k, N) array of the eigenstates ordered by energy
+        (energy, denergy) : tuple of arrays
+            The energies of the eigenstates and the residual norms
+            ||H psi - E psi|| which bound their error.
+        """
+        assert 1 <= k < self.N - 1
+        # for a real potential H maps real functions to real functions, so
+        # the eigenproblem is solved as a real symmetric one
+        V_x = self.potential()
+        real = np.isrealobj(V_x)
+        dtype = float if real else complex
+        # H is symmetric for the vectors sqrt(weights)*psi_x
+        root_weights = np.sqrt(self._weights)
+        def matvec(v):
+            H_v = self.apply_hamiltonian(np.ravel(v) / root_weights) * root_weights
+            return np.real(H_v) if real else H_v
+        H = sparse_linalg.LinearOperator((self.N, self.N), matvec=matvec, dtype=dtype)
+        v0 = None
+        if self.psi_mod_x.ndim == 1:
+            v0 = root_weights * (np.real(self.psi_x) if real else self.psi_x)
+        if sigma is None:
+            energy, vectors = sparse_linalg.eigsh(H, k, which="SA", v0=v0, tol=tol,
+                                                  maxiter=maxiter)
+        else:
+            # (H - sigma)^-1 is applied by MINRES, preconditioned by the
+            # inverse magnitude of the diagonal of H - sigma
+            diagonal = np.abs(V_x - sigma + np.mean(self._kinetic()))
+            M = sparse_linalg.LinearOperator((self.N, self.N), dtype=dtype,
+                                             matvec=lambda v: np.ravel(v) / diagonal)
+            H_shifted = sparse_linalg.LinearOperator((self.N, self.N), dtype=dtype,
+                                                     matvec=lambda v: matvec(v) - sigma * np.ravel(v))
+            def solve(b):
+                x, info = sparse_linalg.minres(H_shifted, np.ravel(b), tol=solver_tol,
+                                               M=M, maxiter=10*self.N)
+                if info < 0:
+                    raise RuntimeError("shift-invert solve failed to converge.")
+                return x
+            OPinv = sparse_linalg.LinearOperator((self.N, self.N), matvec=solve,
+                                                 dtype=dtype)
+            energy, vectors = sparse_linalg.eigsh(H, k, sigma=sigma, which="LM", v0=v0,
+                                                  tol=tol, maxiter=maxiter, OPinv=OPinv)
+        order = np.argsort(energy)
+        energy = energy[order]
+        eigenstates = vectors.T[order] / (root_weights * np.sqrt(self.dx))
+        residual = self.apply_hamiltonian(eigenstates) - energy[:, np.newaxis] * eigenstates
+        denergy = np.sqrt(self.dx * np.sum(self._weights * np.abs(residual) ** 2, axis=-1))
+        return eigenstates, (energy, denergy)
+
+    def hamiltonian_eigenstates(self, dt, k, Nsteps=1, eps=1e-3, max_iter=1000, trial=None, checkpoint_path=None, checkpoint_every=100, real=False):
+        """
+        Propagate a block of k trial functions in imaginary time to find
+        the k lowest eigenstates at once. After every iteration the
+        block is orthonormalized by a QR decomposition and rotated onto
+        the Ritz vectors of H in the block. States whose energy changes
+        by less than eps per unit of imaginary time are locked, in order
+        of increasing energy, and are no longer propagated.
+
+        Parameters
+        ----------
+        dt : float
+            The small time interval over which to integrate
+        k : int
+            The number of eigenstates to find
+        Nsteps : float, optional
+            The number of intervals to compute per iteration (default = 1)
+        eps : float
+            The criterion for convergence applied to the rate of change of
+            the energy (default = 1e-3)
+        max_iter : float
+            Maximum number of iterations (default = 1000)
+        trial : array_like, optional
+            (k, N) array of initial trial functions (default = random)
+        checkpoint_path : string, optional
+            Every checkpoint_every iterations the search is saved to this
+            file. If the file exists the search resumes from it, and it
+            is removed once the search has converged (default = None)
+        checkpoint_every : int, optional
+            Number of iterations between checkpoints (default = 100)
+        real : bool, optional
+            For a real potential, keep the block real and use real FFTs
+            and propagators, which halves the memory and work of the
+            search. The trial functions are rotated to be real and the
+            eigenstates are returned as a real array (default = False)
+
+        Returns
+        -------
+        eigenstates : array
+            (k, N) array of the eigenstates
+        (energy, denergy) : tuple of arrays
+            The energies of the eigenstates and the residual norms
+            ||H psi - E psi|| which bound their error.
+        """
+        eps = abs(eps)
+        assert eps > 0 and k >= 1
+        if trial is None:
+            trial = np.random.RandomState(0).standard_normal((k, self.N))
+        if real:
+            block = np.array(self._to_real(trial))
+            H = self._real_hamiltonian
+        else:
+            block = np.array(trial, dtype=complex)
+            H = self.apply_hamiltonian
+        assert block.shape == (k, self.N)
+        weights = self._weights.astype(block.real.dtype)
+        root_weights = np.sqrt(weights)
+
+        t0 = self.t
+        steps0 = self.steps
+        psi_x0 = np.copy(self.psi_x)
+
+        locked = np.zeros((0, self.N), dtype=block.dtype)
+        energy = np.zeros(k)
+        denergy = np.zeros(k)
+        old_energy = np.full(k, np.inf)
+        num_iter = 0
+        if checkpoint.exists(checkpoint_path):
+            data = checkpoint.load(checkpoint_path)
+            block, locked = data["block"], data["locked"]
+            energy, denergy = data["energy"], data["denergy"]
+            old_energy, num_iter = data["old_energy"], int(data["num_iter"])
+            t0, psi_x0 = data["t0"][()], data["psi_x0"]
+            steps0 = int(data["steps0"]) if "steps0" in data else self.steps
+            assert len(energy) == k
+        while len(locked) < k:
+            if num_iter >= max_iter:
+                self.t = t0
+                self.steps = steps0
+                self.psi_x = psi_x0
+                raise RuntimeError("faild to converge to " + str(k) + " eigenstates after " + str(num_iter) + " iterations.")
+            num_iter += 1
+
+            if real:
+                self._real_time_step(block, dt, Nsteps)
+            else:
+                self._set_psi_x(block, normalize=False)
+                self.time_step(-1j * dt, Nsteps, normalize=False)
+                block = self.psi_x
+            n = len(locked)
+
+            # deflate the locked states then orthonormalize and rotate
+            # onto the Ritz vectors of the block
+            if n > 0:
+                block -= np.dot(np.dot(block, np.conj(locked * weights).T) * self.dx, locked)
+            Q, R = np.linalg.qr((block * root_weights).T)
+            block = Q.T / (root_weights * np.sqrt(self.dx))
+            H_block = H(block)
+            H_ritz = np.dot(np.conj(block * weights), H_block.T) * self.dx
+            ritz_energy, U = np.linalg.eigh(0.5 * (H_ritz + np.conj(H_ritz).T))
+            block = np.dot(U.T, block)
+            H_block = np.dot(U.T, H_block)
+
+            residual = H_block - ritz_energy[:, np.newaxis] * block
+            energy[n:] = ritz_energy
+            denergy[n:] = np.sqrt(self.dx * np.sum(weights * np.abs(residual) ** 2, axis=-1))
+            converged = np.abs(energy[n:] - old_energy[n:]) < eps * abs(dt) * Nsteps
+            old_energy[n:] = energy[n:]
+
+            # lock the leading converged states
+            num_locked = np.argmin(np.append(converged, False))
+            if num_locked > 0:
+                locked = np.concatenate((locked, block[:num_locked]))
+                block = block[num_locked:]
+
+            if checkpoint_path is not None and num_iter % checkpoint_every == 0:
+                checkpoint.save(checkpoint_path, block=block, locked=locked,
+                                energy=energy, denergy=denergy,
+                                old_energy=old_energy, num_iter=num_iter,
+                                t0=t0, steps0=steps0, psi_x0=psi_x0)
+
+        checkpoint.remove(checkpoint_path)
+        self.t = t0
+        self.steps = steps0
+        self.psi_x = psi_x0
+        return locked, (energy, denergy)
+
+    def energy(self):
+        """
+        Returns the Rayleigh quotient energy <psi|H|psi> of the current
+        state and the residual norm ||H psi - E psi||, which bounds the
+        distance of E from the spectrum of H. Both are computed
+        spectrally, for an ensemble they are arrays with one entry per
+        row.
         """
-        assert wave_fn.shape == self.x.shape
-        return 1/np.sqrt(self.dx*np.sum(np.multiply(np.conj(wave_fn), wave_fn)))
+        mod_x = self.psi_mod_x
+        mod_p = self.psi_mod_p
+        V_x = self.potential()
+        T_mod_p = self._kinetic() * mod_p
+        norm2 = np.sum(np.abs(mod_x) ** 2, axis=-1)
+        energy = (np.real(np.sum(np.conj(mod_p) * T_mod_p, axis=-1)) / self.N
+                  + np.sum(V_x * np.abs(mod_x) ** 2, axis=-1)) / norm2
+        H_mod_x = self._fft.ifft(T_mod_p)
+        H_mod_x += (V_x - np.asarray(energy)[..., np.newaxis]) * mod_x
+        residual = np.sqrt(np.sum(np.abs(H_mod_x) ** 2, axis=-1) / norm2)
+        return energy, residual
 
-    def hamiltonian_eigenstate(self, dt, eigenstates=[], Nsteps=1, eps=1e-3, max_iter=1000):
+    def hamiltonian_eigenstate(self, dt, eigenstates=[], Nsteps=1, eps=1e-3, max_iter=1000, engine="imaginary", sigma=None, check_every=1, verbose=False, checkpoint_path=None, checkpoint_every=100, real=False):
         """
         Propagate the Schrodinger equation in imaginary
-        time to find the ground state.
+        time to find the ground state, or the lowest state orthogonal to
+        the given eigenstates. Every check_every iterations the Rayleigh
+        quotient energy and the residual norm ||H psi - E psi|| are
+        computed, the search has converged once the residual norm is
+        below eps, or once the energy changes by less than eps per unit
+        of imaginary time elapsed between checks. The energy falls at the
+        rate 2 ||H psi - E psi||**2, so this bounds the residual norm by
+        about sqrt(eps/2) whatever the time step.
+
+        With engine="lanczos" the state is found by lanczos_eigenstates
+        instead, as the lowest state above the len(eigenstates) states
+        already found, or the state nearest sigma above them.
 
         Parameters
         ----------
         dt : float
             The small time interval over which to integrate
+        eigenstates : list of arrays, optional
+            Previously found eigenstates which are projected out
         Nsteps : float, optional
-            The number of intervals to compute (default = 1)
+            The number of intervals to compute per iteration (default = 1)
         eps : float
-            The criterion for convergence applied to the norm (default = 1e-3)
+            The criterion for convergence applied to the residual norm and
+            to the rate of change of the energy (default = 1e-3)
         max_iter : float
             Maximum number of iterations (default = 1000)
+        engine : string, optional
+            "imaginary" for imaginary time propagation or "lanczos" for
+            the ARPACK eigensolver (default = "imaginary")
+        sigma : float, optional
+            Energy targeted by the shift-invert lanczos engine
+            (default = None)
+        check_every : int, optional
+            Number of iterations between convergence checks (default = 1)
+        verbose : bool, optional
+            Print the energy and residual norm at every check
+            (default = False)
+        checkpoint_path : string, optional
+            Every checkpoint_every iterations the search, including the
+            list of eigenstates, is saved to this file. If the file
+            exists the search resumes from it, and it is removed once the
+            search has converged (default = None)
+        checkpoint_every : int, optional
+            Number of iterations between checkpoints (default = 100)
+        real : bool, optional
+            For a real potential, propagate a real wave function with real
+            FFTs and propagators, as for hamiltonian_eigenstates. The
+            initial state and eigenstates are rotated to be real and the
+            eigenstate is returned as a real array (default = False)
+
+        Returns
+        -------
+        eigenstate : array
+            Length-N array of the eigenstate
+        (energy, denergy) : tuple
+            The energy of the eigenstate and the residual norm
+            ||H psi - E psi|| which bounds its error.
         """
+        if engine == "lanczos":
+            eigenstate, (energy, denergy) = self.lanczos_eigenstates(len(eigenstates) + 1, sigma=sigma)
+            return eigenstate[-1], (energy[-1], denergy[-1])
+        elif engine != "imaginary":
+            raise ValueError("unknown engine " + str(engine) + ".")
         eps = abs(eps)
-        assert eps > 0
-        eigenstates = np.array(eigenstates)
+        assert eps > 0 and check_every >= 1
+        if self.psi_mod_x.ndim != 1:
+            raise ValueError("hamiltonian_eigenstate requires a single "
+                             "wave function, not an ensemble.")
+        if real:
+            return self._real_eigenstate(dt, eigenstates, Nsteps, eps, max_iter, check_every,
+                                         verbose, checkpoint_path, checkpoint_every)
+        eigenstates = np.array(eigenstates, dtype=complex).reshape(-1, self.N)
         t0 = self.t
+        steps0 = self.steps
         psi_x0 = np.copy(self.psi_x)
-        
-        old_psi = ma.masked_less(np.multiply(np.conj(self.psi_x), self.psi_x), self._near_zero)
-        decay_variance = 2 * eps #the 
+
+        energy = np.inf
         num_iter = 0
-        while (decay_variance > eps):
-            if num_iter > max_iter:
+        if checkpoint.exists(checkpoint_path):
+            data = checkpoint.load(checkpoint_path)
+            eigenstates = data["eigenstates"]
+            energy, num_iter = data["energy"][()], int(data["num_iter"])
+            t0, psi_x0 = data["t0"][()], data["psi_x0"]
+            steps0 = int(data["steps0"]) if "steps0" in data else self.steps
+            self.psi_mod_x = data["psi_mod_x"]
+        while True:
+            if num_iter >= max_iter:
                 self.t = t0
+                self.steps = steps0
                 self.psi_x = psi_x0
-                self.compute_p_from_x()
-                raise RuntimeError("faild to converge to an eigenstate after " + str(num_iter - 1) + " iterations.")
+                raise RuntimeError("faild to converge to an eigenstate after " + str(num_iter) + " iterations.")
             num_iter += 1
-            
-            self.time_step(-1j * dt, Nsteps, normalize = False)
+
+            self.time_step(-1j * dt, Nsteps, normalize=False)
             if len(eigenstates) > 0:
-                for i, eigenstate in enumerate(eigenstates):
-                    Cn = np.sum(np.multiply(self.psi_x, eigenstate))*self.dx
-                    self._set_psi_x(self.psi_x - Cn*eigenstate, normalize=False)
-                self.compute_p_from_x()
-            
-            mask_psi_x = ma.masked_less(np.multiply(np.conj(self.psi_x), self.psi_x), self._near_zero)
-            decay = np.real(mask_psi_x/old_psi) #both values should be real bu just in case force it to be real
-            decay_variance = np.var(decay)
-            print decay_variance
-            #manualy normalize
+                # project out all previous eigenstates at once
+                psi_x = self.psi_x
+                Cn = np.dot(np.conj(eigenstates) * self._weights, psi_x) * self.dx
+                self._set_psi_x(psi_x - np.dot(Cn, eigenstates), normalize=False)
             self.normalize()
-            
-            old_psi = mask_psi_x
-#            pyplot.title("decay")
-#            pyplot.plot(self.x, decay, c='k')
-#            pyplot.show()
-        #ma.log is used rather than np.log so it can handle the zeros in decay
-        energy = -(1.0/(2*dt*Nsteps))*np.mean(ma.log(decay))
-        denergy = -(1.0/(2*dt*Nsteps))*np.std(ma.log(decay))
-        print np.std((-1.0/(2*self.m))*(ma.masked_less(np.diff(self.psi_x,2)/(self.dx**2), self._near_zero)/ma.masked_less(self.psi_x[1:-1], self._near_zero)) + self.V_x[1:-1])
-
-#        energy = 0
-#        denergy = 0
-        eigenstate = np.copy(self.psi_x) 
+
+            if num_iter % check_every == 0:
+                old_energy = energy
+                energy, denergy = self.energy()
+                if verbose:
+                    print num_iter, energy, denergy
+                if abs(energy - old_energy) < eps * abs(dt) * Nsteps * check_every or denergy < eps:
+                    break
+
+            if checkpoint_path is not None and num_iter % checkpoint_every == 0:
+                checkpoint.save(checkpoint_path, psi_mod_x=self.psi_mod_x,
+                                eigenstates=eigenstates, energy=energy,
+                                num_iter=num_iter, t0=t0, steps0=steps0, psi_x0=psi_x0)
+
+        checkpoint.remove(checkpoint_path)
+        eigenstate = np.copy(self.psi_x)
         self.t = t0
+        self.steps = steps0
         self.psi_x = psi_x0
-        self.compute_p_from_x()
         return eigenstate, (energy, denergy)
-        
+
+    def set_eigenbasis(self, eigenstates, energies):
+        """
+        Store an orthonormal set of eigenstates of H, such as those found
+        by lanczos_eigenstates or hamiltonian_eigenstates, for the exact
+        propagation of states inside their span by eigenbasis_psi and
+        eigenbasis_step. Called with None the basis is removed, it is
+        also removed when the grid changes, by regrid or a move of the
+        window of set_window.
+
+        Parameters
+        ----------
+        eigenstates : array_like
+            (k, N) array of the eigenstates in the position representation
+        energies : array_like
+            Length-k array of their energies
+        """
+        if eigenstates is None:
+            self._eigenbasis = None
+            return
+        eigenstates = np.array(eigenstates, dtype=self.dtype, ndmin=2)
+        energies = np.asarray(energies, dtype=float)
+        assert eigenstates.shape[-1] == self.N
+        assert energies.shape == eigenstates.shape[:1]
+        # the projection onto the basis is a single product with the
+        # (N, k) matrix of the weighted conjugate eigenstates
+        projector = np.ascontiguousarray((np.conj(eigenstates) * self._weights).T * self.dx)
+        self._eigenbasis = (eigenstates, energies, projector)
+
+    def eigenbasis_projection(self):
+        """
+        Returns the coefficients of the current state in the eigenbasis of
+        set_eigenbasis, and the norm of the residual outside of its span
+        (per row for an ensemble). Propagation by the eigenbasis is only
+        accurate while the residual is small.
+        """
+        if self._eigenbasis is None:
+            raise RuntimeError("no eigenbasis set, or the grid has changed since, "
+                               "see set_eigenbasis.")
+        eigenstates, energies, projector = self._eigenbasis
+        psi_x = self.psi_x
+        coefficients = np.dot(psi_x, projector)
+        outside = psi_x - np.dot(coefficients, eigenstates)
+        residual = np.sqrt(self.dx * np.sum(self._weights * np.abs(outside) ** 2, axis=-1))
+        return coefficients, residual
+
+    def eigenbasis_psi(self, t):
+        """
+        Returns the wave function at the time or array of times t,
+        propagated exactly in the eigenbasis of set_eigenbasis, and the
+        norm of the residual of the current state outside of the basis.
+        The solver itself is not advanced.
+
+        Parameters
+        ----------
+        t : float or array_like
+            The time, or a length-T array of times
+
+        Returns
+        -------
+        psi_x : array
+            The wave function at t, with a leading axis of length T if t
+            is an array
+        residual : float or array
+            The norm of the part of the current state which is not
+            represented by the basis
+        """
+        coefficients, residual = self.eigenbasis_projection()
+        eigenstates, energies, projector = self._eigenbasis
+        t = np.asarray(t, dtype=float)
+        phases = np.exp(-1j * np.multiply.outer(t - np.real(self.t), energies))
+        if coefficients.ndim == 2:
+            phases = phases[..., np.newaxis, :]
+        psi_x = np.dot((phases * coefficients).astype(self.dtype), eigenstates)
+        return psi_x, residual
+
+    def eigenbasis_step(self, dt, Nsteps=1):
+        """
+        Advance the solver by dt * Nsteps exactly in the eigenbasis of
+        set_eigenbasis, at the cost of two products with the (k, N)
+        basis. The part of the state outside of the basis is discarded
+        and the norm of this residual is returned.
+        """
+        psi_x, residual = self.eigenbasis_psi(np.real(self.t) + dt * Nsteps)
+        self._set_psi_x(psi_x, normalize=False)
+        self.t += dt * Nsteps
+        self.steps += Nsteps
+        return residual
+
+    def _real_eigenstate(self, dt, eigenstates, Nsteps, eps, max_iter, check_every, verbose, checkpoint_path, checkpoint_every):
+        """
+        The imaginary time search of hamiltonian_eigenstate with real=True.
+        The solver state is not touched.
+        """
+        eigenstates = self._to_real(np.reshape(eigenstates, (-1, self.N)))
+        psi_x = self._to_real(self.psi_x)
+        weights = self._weights.astype(psi_x.dtype)
+
+        energy = np.inf
+        num_iter = 0
+        if checkpoint.exists(checkpoint_path):
+            data = checkpoint.load(checkpoint_path)
+            eigenstates, psi_x = data["eigenstates"], data["psi_x"]
+            energy, num_iter = data["energy"][()], int(data["num_iter"])
+        while True:
+            if num_iter >= max_iter:
+                raise RuntimeError("faild to converge to an eigenstate after " + str(num_iter) + " iterations.")
+            num_iter += 1
+
+            self._real_time_step(psi_x, dt, Nsteps)
+            if len(eigenstates) > 0:
+                psi_x -= np.dot(np.dot(eigenstates * weights, psi_x) * self.dx, eigenstates)
+            psi_x /= np.sqrt(self.dx * np.sum(weights * psi_x ** 2))
+
+            if num_iter % check_every == 0:
+                old_energy = energy
+                H_psi_x = self._real_hamiltonian(psi_x)
+                energy = self.dx * np.sum(weights * psi_x * H_psi_x)
+                denergy = np.sqrt(self.dx * np.sum(weights * (H_psi_x - energy * psi_x) ** 2))
+                if verbose:
+                    print num_iter, energy, denergy
+                if abs(energy - old_energy) < eps * abs(dt) * Nsteps * check_every or denergy < eps:
+                    break
+
+            if checkpoint_path is not None and num_iter % checkpoint_every == 0:
+                checkpoint.save(checkpoint_path, psi_x=psi_x, eigenstates=eigenstates,
+                                energy=energy, num_iter=num_iter)
+
+        checkpoint.remove(checkpoint_path)
+        return psi_x, (energy, denergy)
+
+    def is_symmetric(self):
+        """
+        Returns True if the potential is even about x[N//2] on a periodic
+        grid of an even number of points, V_x[N//2 + j] = V_x[N//2 - j]
+        with the indices taken modulo N, as for x = dx*(arange(N) - N/2)
+        and a potential which is even in x.
+        """
+        if self.boundary != "periodic" or self.N % 2 != 0:
+            return False
+        V_x = self.potential()
+        return np.allclose(V_x, np.roll(V_x[::-1], 1))
+
+    def _fold(self, psi_x, parity):
+        """
+        Returns the part of psi_x (each row of an ensemble) of the given
+        parity about x[N//2], on the grid of parity_sector.
+        """
+        h = self.N // 2
+        psi_x = np.asarray(psi_x)
+        mirror = np.roll(psi_x[..., ::-1], 1, axis=-1)
+        folded = np.sqrt(0.5) * (psi_x + parity * mirror)
+        if parity == 1:
+            return np.concatenate((folded[..., h:], folded[..., :1]), axis=-1)
+        return folded[..., h + 1:]
+
+    def _unfold(self, psi_x, parity):
+        """
+        Returns the wave function on the full grid of a state psi_x of the
+        solver of parity_sector(parity), the inverse of _fold.
+        """
+        h = self.N // 2
+        psi_x = np.asarray(psi_x)
+        half = np.zeros(psi_x.shape[:-1] + (h + 1,), dtype=psi_x.dtype)
+        if parity == 1:
+            half[...] = psi_x
+        else:
+            half[..., 1:h] = psi_x
+        half *= np.sqrt(0.5)
+        unfolded = np.zeros(psi_x.shape[:-1] + (self.N,), dtype=psi_x.dtype)
+        unfolded[..., h:] = half[..., :h]
+        unfolded[..., h:0:-1] = parity * half[..., :h]
+        unfolded[..., 0] = half[..., h]
+        return unfolded
+
+    def parity_sector(self, parity):
+        """
+        Returns a solver for the even (parity = 1) or odd (parity = -1)
+        states of a symmetric potential (see is_symmetric) on half of the
+        grid, x >= x[N//2]. The even states are solved with Neumann walls
+        at x[N//2] and x[N//2] + N dx/2, the odd states with Dirichlet
+        walls there, which are exact restrictions of the periodic grid.
+        The solver starts in the part of the current state with this
+        parity, or in a constant if there is none.
+
+        Parameters
+        ----------
+        parity : int
+            1 for the even sector, -1 for the odd sector
+        """
+        assert parity in (1, -1) and self.boundary == "periodic" and self.N % 2 == 0
+        h = self.N // 2
+        V_x = self.potential()
+        if parity == 1:
+            x = self.x[h] + self.dx * np.arange(h + 1)
+            V_x = np.append(V_x[h:], V_x[0])
+            boundary = "neumann"
+        else:
+            x = self.x[h] + self.dx * np.arange(1, h)
+            V_x = V_x[h + 1:]
+            boundary = "dirichlet"
+        psi_x = self._fold(self.psi_x, parity)
+        if np.any(self.dx * np.sum(np.abs(psi_x[..., 1:-1]) ** 2, axis=-1) < self._near_zero):
+            psi_x = np.ones(psi_x.shape)
+        return Schrodinger(x, psi_x, V_x, m=self.m, fft=self._fft, cache=self.cache, dtype=self.dtype,
+                           integrator=self.integrator, boundary=boundary)
+
+    def parity_eigenstates(self, k, dt=None, Nsteps=1, eps=1e-3, max_iter=1000, engine="imaginary", sigma=None, real=False, symmetric=None):
+        """
+        Find the k lowest eigenstates of a symmetric potential by solving
+        for the even and odd states separately with the solvers of
+        parity_sector, each on half of the grid. The states of one
+        parity never have to be deflated from the search for the other.
+        The bound states of a symmetric potential alternate in parity, so
+        each sector is asked for (k + 1)//2 + 1 states, and for more only
+        if all of the states it found are among the k lowest.
+
+        Parameters
+        ----------
+        k : int
+            The number of eigenstates to find
+        dt : float, optional
+            The imaginary time step of the "imaginary" engine
+        Nsteps, eps, max_iter, real : optional
+            As for hamiltonian_eigenstates, used by the "imaginary" engine
+        engine : string, optional
+            "imaginary" to use hamiltonian_eigenstates or "lanczos" to use
+            lanczos_eigenstates, with sigma, in each sector
+            (default = "imaginary")
+        sigma : float, optional
+            As for lanczos_eigenstates (default = None)
+        symmetric : bool, optional
+            True if the potential is known to be symmetric, the values of
+            V_x on x >= x[N//2] are then used. By default the symmetry is
+            checked with is_symmetric and a ValueError is raised if the
+            potential is not symmetric.
+
+        Returns
+        -------
+        eigenstates : array
+            (k, N) array of the eigenstates ordered by energy, each is
+            even or odd about x[N//2]
+        (energy, denergy) : tuple of arrays
+            The energies of the eigenstates and the residual norms
+            ||H psi - E psi|| which bound their error.
+        """
+        if engine not in ("imaginary", "lanczos"):
+            raise ValueError("unknown engine " + str(engine) + ".")
+        if engine == "imaginary" and dt is None:
+            raise ValueError("the imaginary engine requires dt.")
+        if symmetric is None:
+            symmetric = self.is_symmetric()
+        if not symmetric or self.boundary != "periodic" or self.N % 2 != 0:
+            raise ValueError("parity_eigenstates requires a potential which is even "
+                             "about x[N//2] on a periodic grid of an even number of points.")
+
+        # distance of an energy from the target of the search
+        distance = (lambda E: E) if sigma is None else (lambda E: np.abs(E - sigma))
+        sectors = dict((parity, self.parity_sector(parity)) for parity in (1, -1))
+        counts = dict((parity, min((k + 1) // 2 + 1, sectors[parity].N - 2)) for parity in (1, -1))
+        results = {}
+        while True:
+            for parity, sector in sectors.items():
+                if parity in results and len(results[parity][1]) == counts[parity]:
+                    continue
+                if engine == "lanczos":
+                    states, (E, dE) = sector.lanczos_eigenstates(counts[parity], sigma=sigma)
+                else:
+                    states, (E, dE) = sector.hamiltonian_eigenstates(dt, counts[parity], Nsteps, eps, max_iter, real=real)
+                results[parity] = (self._unfold(states, parity), E, dE)
+            energy = np.concatenate([results[parity][1] for parity in (1, -1)])
+            kth = np.sort(distance(energy))[min(k, len(energy)) - 1]
+            # a sector whose states are all among the k nearest may hold
+            # more of them
+            retry = [parity for parity in (1, -1) if counts[parity] < sectors[parity].N - 2
+                     and np.max(distance(results[parity][1])) < kth]
+            if not retry:
+                break
+            for parity in retry:
+                counts[parity] = min(2 * counts[parity], sectors[parity].N - 2)
+
+        eigenstates, energy, denergy = [np.concatenate([results[parity][i] for parity in (1, -1)])
+                                        for i in range(3)]
+        nearest = np.argsort(distance(energy))[:k]
+        order = nearest[np.argsort(energy[nearest])]
+        return eigenstates[order], (energy[order], denergy[order])
+
+    def save_checkpoint(self, path):
+        """
+        Atomically save the full state of the solver, the wave function
+        buffers, time, time step and current propagators, as raw arrays.
+        The solver can be restored with Schrodinger.load_checkpoint.
+
+        Parameters
+        ----------
+        path : string
+            The checkpoint file
+        """
+        arrays = {"x":self.x, "V_x":self.V_x, "m":self.m, "t":self.t,
+                  "steps":self.steps, "rep":self._rep, "boundary":self.boundary}
+        if self._rep != "p":
+            arrays["psi_mod_x"] = self._mod_x
+        if self._rep != "x":
+            arrays["psi_mod_p"] = self._mod_p
+        if self.absorber is not None:
+            arrays.update(absorber=self.absorber, absorbed=self.absorbed)
+        if self.integrator is not integrators.strang:
+            arrays.update(integrator=self.integrator.name,
+                          integrator_a=self.integrator.a,
+                          integrator_b=self.integrator.b,
+                          integrator_order=self.integrator.order)
+        if self.dt_ is not None:
+            arrays.update(dt=self.dt_, x_evolve_half=self.x_evolve_half,
+                          x_evolve=self.x_evolve, p_evolve=self.p_evolve)
+        checkpoint.save(path, **arrays)
+
+    @classmethod
+    def load_checkpoint(cls, path, fft=None, workers=1, cache=None):
+        """
+        Returns a solver restored from a checkpoint written by
+        save_checkpoint, which continues bit-for-bit from the saved
+        state.
+
+        Parameters
+        ----------
+        path : string
+            The checkpoint file
+        fft, workers, cache : optional
+            As for Schrodinger.__init__
+        """
+        data = checkpoint.load(path)
+        rep = str(data["rep"])
+        psi_mod = data["psi_mod_x"] if rep != "p" else data["psi_mod_p"]
+        solver = cls(data["x"], np.ones(psi_mod.shape, dtype=complex),
+                     data["V_x"], m=data["m"][()], fft=fft, workers=workers,
+                     cache=cache, dtype=psi_mod.dtype,
+                     boundary=str(data["boundary"]) if "boundary" in data else "periodic")
+        solver.t = data["t"][()]
+        solver.steps = int(data["steps"])
+        if rep != "p":
+            solver._mod_x[...] = data["psi_mod_x"]
+        if rep != "x":
+            solver._mod_p[...] = data["psi_mod_p"]
+        solver._rep = rep
+        if "integrator" in data:
+            solver.integrator = integrators.Splitting(str(data["integrator"]),
+                                                      data["integrator_a"],
+                                                      data["integrator_b"],
+                                                      int(data["integrator_order"]))
+        if "absorber" in data:
+            solver.absorber = data["absorber"]
+            solver.absorbed = data["absorbed"][()]
+            solver._V_token = next(Schrodinger._V_tokens)
+        if "dt" in data:
+            dt = data["dt"][()]
+            solver.dt_ = dt
+            solver._propagator_key = (dt, solver._V_token, solver.m)
+            solver.x_evolve_half = data["x_evolve_half"]
+            solver.x_evolve = data["x_evolve"]
+            solver.p_evolve = data["p_evolve"]
+            solver.cache.put(("x", 0.5 * dt, solver._V_token), solver.x_evolve_half)
+            solver.cache.put(("x", dt, solver._V_token), solver.x_evolve)
+            solver.cache.put(kinetic_key(dt, solver.m, solver.N, solver.dx, solver.dtype, solver.boundary),
+                             solver.p_evolve)
+        return solver
+
+    def add_observable(self, name, func=None, space="x", every=1):
+        """
+        Register an observable which is evaluated every few substeps of
+        real time propagation, see the observables module. The values
+        accumulate across calls of time_step and are read with
+        observable(name).
+
+        Parameters
+        ----------
+        name : string or observables.Observable
+            The name of a built-in observable, "norm", "x", "p",
+            "kinetic", "potential" or "energy", the name of a new
+            observable computed by func, or an Observable instance
+        func : callable, optional
+            Function of psi_x, psi_p or (psi_x, psi_p) depending on space
+        space : string, optional
+            "x", "p" or "both" (default = "x")
+        every : int, optional
+            Number of substeps between evaluations (default = 1)
+        """
+        if isinstance(name, observables.Observable):
+            observable = name
+        elif func is None:
+            try:
+                observable = observables.builtins[name](every=every)
+            except KeyError:
+                raise ValueError("unknown built-in observable " + str(name) + ".")
+        else:
+            observable = observables.Observable(name, func, space, every)
+        self.observables[observable.name] = observable
+        return observable
+
+    def remove_observable(self, name):
+        del self.observables[name]
+
+    def observable(self, name):
+        """
+        Returns the sample times and values recorded for an observable.
+        """
+        observable = self.observables[name]
+        return observable.times, observable.values
+
+    def run(self, t_max, dt, every=1, writer=None, checkpoint_path=None, checkpoint_every=1):
+        """
+        Generator which advances the solver from its current time to
+        t_max, every time-steps at a time, yielding the time after each
+        block of steps. The last block is shortened so that the run ends
+        at the first time step at or past t_max. If a writer such as
+        trajectory.TrajectoryWriter is given the initial state and the
+        state after every block is written to it, and the writer is
+        closed when the run ends, also when the generator is closed or
+        abandoned early or the loop raises.
+
+        Parameters
+        ----------
+        t_max : float
+            The time at which the run ends
+        dt : float
+            The small time interval over which to integrate
+        every : int, optional
+            Number of time-steps between yields and snapshots (default = 1)
+        writer : TrajectoryWriter, optional
+            Stream the snapshots to disk (default = None)
+        checkpoint_path : string, optional
+            Save a checkpoint of the solver to this file every
+            checkpoint_every blocks (default = None)
+        checkpoint_every : int, optional
+            Number of blocks between checkpoints (default = 1)
+        """
+        assert every >= 1
+        num_steps = int(np.ceil((t_max - self.t) / dt - 1e-9))
+        try:
+            if writer is not None:
+                writer.write(self)
+            for block, step in enumerate(xrange(0, num_steps, every)):
+                self.time_step(dt, min(every, num_steps - step))
+                if writer is not None:
+                    writer.write(self)
+                if checkpoint_path is not None and (block + 1) % checkpoint_every == 0:
+                    self.save_checkpoint(checkpoint_path)
+                yield self.t
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def evolve(self, t_max, dt, tol=1e-8, dt_min=None, dt_max=None, ladder=2 ** 0.25, normalize=True):
+        """
+        Advance the solver to t_max with adaptive time steps. The local
+        error of each step is estimated by step doubling, comparing one
+        step of dt with two steps of dt/2, and the step is accepted, with
+        the two half steps, if the estimate
+        ||psi_dt - psi_dt/2||/(2**q - 1), for a scheme of order q, is
+        below tol. The next step is grown or shrunk by the usual
+        controller 0.9*(tol/error)**(1/(q + 1)), limited to a factor
+        between 0.2 and 4. Time steps are restricted to the ladder
+        dt*ladder**n for integer n, so the propagators of the few step
+        sizes in use stay in the propagator cache.
+
+        Observables are evaluated at the end of every accepted step, their
+        every counting accepted steps, and the window of set_window
+        follows the wave function after every accepted step.
+
+        Parameters
+        ----------
+        t_max : float
+            The time at which to stop
+        dt : float
+            The initial time step, and the base of the ladder
+        tol : float, optional
+            Tolerance of the estimated local error of each step
+            (default = 1e-8)
+        dt_min : float, optional
+            A RuntimeError is raised if the step has to shrink below
+            dt_min (default = dt*1e-6)
+        dt_max : float, optional
+            Upper limit of the step (default = no limit)
+        ladder : float, optional
+            Ratio of neighbouring step sizes (default = 2**0.25)
+        normalize : bool, optional
+            As for time_step (default = True)
+
+        Returns
+        -------
+        stats : dict
+            The numbers of accepted and rejected steps, the number of FFT
+            pairs spent, and the smallest and largest accepted steps
+            (apart from the final step, which is cut to end at t_max).
+            Also stored as self.step_stats.
+        """
+        assert dt > 0 and tol > 0 and ladder > 1
+        dt_min = dt * 1e-6 if dt_min is None else dt_min
+        dt_max = np.inf if dt_max is None else dt_max
+        order = self.integrator.order
+        V_func, self._V_func = self._V_func, None
+        observed, self.observables = self.observables, {}
+        stats = {"accepted":0, "rejected":0, "fft_pairs":0,
+                 "dt_min":np.inf, "dt_max":0.0}
+        self.step_stats = stats
+        for obs in observed.values():
+            obs._reserve(0)
+        n = 0
+        try:
+            while self.t < t_max * (1 - 1e-12):
+                step = dt * ladder ** n
+                if step > dt_max:
+                    n = int(np.floor(np.log(dt_max / dt) / np.log(ladder)))
+                    step = dt * ladder ** n
+                last = step >= t_max - self.t
+                if last:
+                    step = t_max - self.t
+                saved = (np.copy(self.psi_mod_x), self.t, self.steps, self.absorbed)
+
+                # one step of dt, then two of dt/2 from the same state
+                self.time_step(step, 1, normalize)
+                psi_full = np.copy(self._mod_x)
+                self._set_psi_mod_x(saved[0])
+                self.t, self.steps, self.absorbed = saved[1:]
+                self.time_step(0.5 * step, 2, normalize)
+                stats["fft_pairs"] += 3 * self.integrator.stages
+
+                difference = np.abs(psi_full - self._mod_x) ** 2
+                error = np.max(np.sqrt(2 * np.pi / self.dx * np.sum(difference, axis=-1)))
+                error /= 2 ** order - 1
+                if error > 0:
+                    factor = min(max(0.9 * (tol / error) ** (1.0 / (order + 1)), 0.2), 4.0)
+                else:
+                    factor = 4.0
+                change = int(np.floor(np.log(factor) / np.log(ladder)))
+                if error <= tol:
+                    stats["accepted"] += 1
+                    if not last:
+                        stats["dt_min"] = min(stats["dt_min"], step)
+                        stats["dt_max"] = max(stats["dt_max"], step)
+                    for obs in observed.values():
+                        if stats["accepted"] % obs.every == 0:
+                            obs._append(self.t, obs.evaluate(self, self.psi_mod_x, self.psi_mod_p))
+                    if V_func is not None:
+                        self._V_func = V_func
+                        self._follow()
+                        self._V_func = None
+                    if not last:
+                        n += change
+                else:
+                    stats["rejected"] += 1
+                    self._set_psi_mod_x(saved[0])
+                    self.t, self.steps, self.absorbed = saved[1:]
+                    n += min(change, -1)
+                    if dt * ladder ** n < dt_min:
+                        raise RuntimeError("time step fell below dt_min at t = " + str(self.t) + ".")
+        finally:
+            self._V_func = V_func
+            self.observables = observed
+            for obs in observed.values():
+                obs._trim()
+        return stats
 
     def time_step(self, dt, Nsteps=1, normalize = True):
         """
         Perform a series of time-steps via the time-dependent Schrodinger
-        Equation.
+        Equation. For an ensemble every row is advanced by the same
+        split-operator step, with the FFTs taken along the last axis.
+        Real time steps use the splitting scheme self.integrator and the
+        time dependent potential of set_drive, imaginary time steps
+        always use Strang splitting and the potential frozen at the real
+        part of the current time, see set_drive.
 
         Parameters
         ----------
@@ -247,21 +1758,392 @@ class Schrodinger(object):
         Nsteps : float, optional
             The number of intervals to compute.  The total change in time at
             the end of this method will be dt * Nsteps (default = 1)
+        normalize : bool, optional
+            Normalize the wave function after the steps, ignored for real
+            time steps while an absorber is set (default = True)
         """
         assert Nsteps >= 0
+        if self._V_func is not None and np.isreal(dt) and Nsteps > self._window_every:
+            # let the window of set_window follow every few substeps
+            for step in xrange(0, Nsteps, self._window_every):
+                self.time_step(dt, min(self._window_every, Nsteps - step), normalize)
+            return
         self.dt = dt
-        if Nsteps > 0:
-            self.psi_mod_x *= self.x_evolve_half
+        absorbing = Nsteps > 0 and self.absorber is not None and np.isreal(dt)
+        if absorbing:
+            normalize = False
+            norm2 = self._norm2()
+        driven = self._drive_V is not None or self._drive_V1 is not None
+        if Nsteps > 0 and np.isreal(dt) and (driven or self.integrator is not integrators.strang):
+            self._split_time_step(dt, Nsteps)
+            if normalize:
+                self.normalize()
+        elif Nsteps > 0 and self.observables and np.isreal(dt):
+            self._observed_time_step(dt, Nsteps)
+            if normalize:
+                self.normalize()
+        elif Nsteps > 0:
+            x_evolve_half, x_evolve = self.x_evolve_half, self.x_evolve
+            if driven:
+                # imaginary time, with the drive frozen at the current time
+                x_evolve_half = self._driven_factor(0.5 * dt, np.real(self.t))
+                x_evolve = x_evolve_half ** 2
+            mod_x = self.psi_mod_x
+            mod_p = self._mod_p
+            mod_x *= x_evolve_half
             for num_iter in xrange(Nsteps - 1):
-                self.compute_p_from_x()
-                self.psi_mod_p *= self.p_evolve
-                self.compute_x_from_p()
-                self.psi_mod_x *= self.x_evolve
-            self.compute_p_from_x()
-            self.psi_mod_p *= self.p_evolve
-            self.compute_x_from_p()
-            self.psi_mod_x *= self.x_evolve_half
+                self._fft.fft(mod_x, out=mod_p)
+                mod_p *= self.p_evolve
+                self._fft.ifft(mod_p, out=mod_x)
+                mod_x *= x_evolve
+            self._fft.fft(mod_x, out=mod_p)
+            mod_p *= self.p_evolve
+            self._fft.ifft(mod_p, out=mod_x)
+            mod_x *= x_evolve_half
+            # only the x-space buffer is current, psi_p is computed when read
+            self._rep = "x"
             if normalize:
                 self.normalize()
-            self.compute_p_from_x()
             self.t += dt * Nsteps
+            self.steps += Nsteps
+        if absorbing:
+            absorbed = np.squeeze(norm2 - self._norm2())
+            self.absorbed = self.absorbed + (absorbed if absorbed.ndim else absorbed[()])
+        if Nsteps > 0 and self._V_func is not None and np.isreal(dt):
+            self._follow()
+
+    def _observed_time_step(self, dt, Nsteps):
+        """
+        The split-operator loop of time_step, evaluating the registered
+        observables. On substeps where an x-space observable is due the
+        merged potential step is split into two half steps so the
+        observable sees the state at the end of the substep.
+        """
+        x_obs = [obs for obs in self.observables.values() if obs.space == "x"]
+        p_obs = [obs for obs in self.observables.values() if obs.space != "x"]
+        n0 = self.steps
+        t0 = self.t
+        for obs in x_obs:
+            obs._reserve((n0 + Nsteps) // obs.every - n0 // obs.every)
+        for obs in p_obs:
+            obs._reserve((n0 + Nsteps - 1) // obs.every - (n0 - 1) // obs.every)
+
+        mod_x = self.psi_mod_x
+        mod_p = self._mod_p
+        mod_x *= self.x_evolve_half
+        for num_iter in xrange(Nsteps):
+            n = n0 + num_iter
+            self._fft.fft(mod_x, out=mod_p)
+            mod_p *= self.p_evolve
+            for obs in p_obs:
+                if n % obs.every == 0:
+                    obs._record(t0 + (num_iter + 0.5) * dt, obs.evaluate(self, mod_x, mod_p))
+            self._fft.ifft(mod_p, out=mod_x)
+            due = [obs for obs in x_obs if (n + 1) % obs.every == 0]
+            if due or num_iter == Nsteps - 1:
+                mod_x *= self.x_evolve_half
+                for obs in due:
+                    obs._record(t0 + (num_iter + 1) * dt, obs.evaluate(self, mod_x, mod_p))
+                if num_iter < Nsteps - 1:
+                    mod_x *= self.x_evolve_half
+            else:
+                mod_x *= self.x_evolve
+        self._rep = "x"
+        self.t += dt * Nsteps
+        self.steps += Nsteps
+
+    def chebyshev_step(self, dt, Nsteps=1, normalize=True, tol=1e-14, max_order=100000):
+        """
+        Propagate by Nsteps*dt in one step, with a Chebyshev expansion of
+        exp(-1j H dt Nsteps). The spectrum of H lies in
+        [min(V_x), max(V_x) + max(p**2/(2 m))], and on this range the
+        expansion converges to tol once its order is beyond about half
+        the width of the range times the time step, or the square root of
+        that for imaginary time. Every order costs one
+        application of H, that is two FFTs, so large jumps of a smooth
+        potential at moderate resolution are much cheaper than with
+        time_step, which needs many small steps for the same accuracy.
+        Walls such as V_x = 1E30 make the range, and the order, huge,
+        use set_absorber instead. The absorber, observables and window
+        are ignored by this method, and a drive (see set_drive) is
+        frozen at the current time.
+
+        In imaginary time the terms of the expansion, of about
+        1/sqrt(order), cancel down to exp(-(E - min(V_x)) tau) for the
+        energy E of the state, so precision is lost over long steps.
+        These are split into sub-steps over which
+        (E - min(V_x)) tau <= chebyshev_limit for the Rayleigh quotient
+        energy E at the start of each, with the wave function
+        renormalized between them.
+
+        Parameters
+        ----------
+        dt : float or complex
+            The time interval, real for real time or -1j*tau for
+            imaginary time as in time_step
+        Nsteps : int, optional
+            The total time is dt * Nsteps, taken as a single expansion
+            (default = 1)
+        normalize : bool, optional
+            Normalize the wave function afterwards (default = True)
+        tol : float, optional
+            Magnitude below which the expansion is truncated
+            (default = 1e-14)
+        max_order : int, optional
+            The largest allowed order of an expansion, a ValueError is
+            raised if more terms are needed (default = 100000)
+
+        Returns
+        -------
+        order : int
+            The order of the expansion used, the total over the sub-steps
+            in imaginary time
+        """
+        assert Nsteps >= 0
+        if Nsteps == 0:
+            return 0
+        dt = complex(dt) * Nsteps
+        if dt.real != 0 and dt.imag != 0:
+            raise ValueError("chebyshev_step requires a real or imaginary dt.")
+
+        if dt.imag == 0:
+            order = self._chebyshev_expansion(dt, tol, max_order)
+            if normalize:
+                self.normalize()
+            self.t += dt.real
+        else:
+            tau = -dt.imag
+            E_min = np.min(np.real(self.potential()))
+            order = 0
+            log_norm = 0
+            while tau != 0:
+                E = np.max(self.energy()[0])
+                tau_sub = tau
+                if (E - E_min) * abs(tau) > self.chebyshev_limit:
+                    tau_sub = np.sign(tau) * self.chebyshev_limit / (E - E_min)
+                order += self._chebyshev_expansion(-1j * tau_sub, tol, max_order)
+                log_norm = log_norm + 0.5 * np.log(self._norm2())
+                self.normalize()
+                tau = tau - tau_sub if tau_sub != tau else 0
+            if not normalize:
+                self._mod_x *= np.exp(log_norm).astype(self._real_dtype)
+            self.t += dt
+        self.steps += Nsteps
+        return order
+
+    def _chebyshev_expansion(self, dt, tol, max_order):
+        """
+        Apply the Chebyshev expansion of exp(-1j H dt), for a real or
+        imaginary dt, to psi_mod_x without normalizing it. Returns the
+        order of the expansion.
+        """
+        imaginary = dt.imag != 0
+        V_x = np.real(self.potential())
+        T = self._kinetic()
+        E_min = np.min(V_x)
+        E_max = np.max(V_x) + np.max(T)
+        E_mid = 0.5 * (E_max + E_min)
+        E_half = 0.5 * (E_max - E_min) * (1 + 1e-12)
+
+        # expansion coefficients of exp(-1j H dt) or exp(-H tau)
+        z = E_half * (-dt.imag if imaginary else dt.real)
+        order = int(abs(z) + 10 * abs(z) ** (1.0 / 3) + 50)
+        if imaginary:
+            # the coefficients fall as exp(-k**2/(2 z))
+            order = min(order, int(2 * np.sqrt(abs(z) * np.log(1 / tol))) + 50)
+        k = np.arange(order)
+        if imaginary:
+            coefficients = (-1.0) ** k * special.ive(k, z) * np.exp(-E_min * z / E_half)
+        else:
+            coefficients = np.array([1, -1j, -1, 1j])[k % 4] * special.jv(k, z) * np.exp(-1j * E_mid * dt.real)
+        coefficients[1:] *= 2
+        large = np.nonzero(np.abs(coefficients) > tol * np.max(np.abs(coefficients)))[0]
+        order = large[-1] + 1
+        if order > max_order:
+            raise ValueError("the Chebyshev expansion needs " + str(order) +
+                             " terms, more than max_order.")
+        coefficients = coefficients[:order].astype(self.dtype)
+
+        # three term recurrence of T_k((H - E_mid)/E_half) psi
+        scaled_T = ((T - E_mid) / E_half).astype(self._real_dtype)
+        scaled_V = (V_x / E_half).astype(self._real_dtype)
+        def apply_scaled(phi, out):
+            self._fft.fft(phi, out=self._mod_p)
+            self._mod_p *= scaled_T
+            self._fft.ifft(self._mod_p, out=out)
+            out += scaled_V * phi
+            return out
+        phi_prev = np.copy(self.psi_mod_x)
+        result = coefficients[0] * phi_prev
+        if order > 1:
+            phi = apply_scaled(phi_prev, self._fft.empty(phi_prev.shape, self.dtype))
+            result += coefficients[1] * phi
+            phi_next = self._fft.empty(phi_prev.shape, self.dtype)
+            for c_k in coefficients[2:]:
+                apply_scaled(phi, phi_next)
+                phi_next *= 2
+                phi_next -= phi_prev
+                result += c_k * phi_next
+                phi_prev, phi, phi_next = phi, phi_next, phi_prev
+        self._mod_x[...] = result
+        self._rep = "x"
+        return order
+
+    def _split_time_step(self, dt, Nsteps):
+        """
+        The time_step loop of a splitting scheme other than Strang, or of
+        any scheme with a time dependent potential, see the integrators
+        module. Each potential stage of a driven potential uses the time
+        reached by the preceding kinetic stages. Observables are
+        evaluated at the end of the steps on which they are due, those
+        in p-space after an extra FFT.
+        """
+        scheme = self.integrator
+        driven = self._drive_V is not None or self._drive_V1 is not None
+        stage_times = np.concatenate(([0], np.cumsum(scheme.b)))
+        if driven:
+            x_stage = lambda coefficient, t: self._driven_factor(coefficient * dt, t)
+        else:
+            factors = {}
+            def x_stage(coefficient, t):
+                if coefficient not in factors:
+                    factors[coefficient] = self._x_factor(coefficient * dt)
+                return factors[coefficient]
+        p_stages = [self._p_factor(b * dt) for b in scheme.b]
+        observed = self.observables.values()
+        n0 = self.steps
+        t0 = self.t
+        for obs in observed:
+            obs._reserve((n0 + Nsteps) // obs.every - n0 // obs.every)
+
+        mod_x = self.psi_mod_x
+        mod_p = self._mod_p
+        mod_x *= x_stage(scheme.a[0], t0)
+        for num_iter in xrange(Nsteps):
+            t_n = t0 + num_iter * dt
+            for stage in xrange(scheme.stages):
+                if stage > 0:
+                    mod_x *= x_stage(scheme.a[stage], t_n + stage_times[stage] * dt)
+                self._fft.fft(mod_x, out=mod_p)
+                mod_p *= p_stages[stage]
+                self._fft.ifft(mod_p, out=mod_x)
+            n = n0 + num_iter + 1
+            self.t = t0 + (num_iter + 1) * dt
+            due = [obs for obs in observed if n % obs.every == 0]
+            if due or num_iter == Nsteps - 1:
+                mod_x *= x_stage(scheme.a[-1], self.t)
+                if any(obs.space != "x" for obs in due):
+                    self._fft.fft(mod_x, out=mod_p)
+                for obs in due:
+                    obs._record(self.t, obs.evaluate(self, mod_x, mod_p))
+                if num_iter < Nsteps - 1:
+                    mod_x *= x_stage(scheme.a[0], self.t)
+            else:
+                mod_x *= x_stage(scheme.a[0] + scheme.a[-1], self.t)
+        self._rep = "x"
+        self.t = t0 + dt * Nsteps
+        self.steps += Nsteps
+
+def precision_drift(x, psi_x0, V_x, dt, Nsteps, every=1, m=1, fft=None):
+    """
+    Propagate the same initial state with complex64 and complex128
+    solvers side by side and measure how far the single precision run
+    drifts from the double precision one.
+
+    Single precision stores the state and the propagator phases to a
+    relative precision of about 6e-8, and the rounding errors of each
+    step accumulate. For a gaussian packet scattering off a gaussian
+    barrier on a 2**11 point grid the distance ||psi_64 - psi_128||
+    was measured as about 8e-5 after 1e3 steps, 6e-4 after 1e4 steps
+    and 5e-3 after 1e5 steps, independent of dt. complex64 is therefore
+    safe for visualization of runs up to about 1e5 steps, longer runs
+    or observables needing more than about three significant digits
+    should be checked with this function first.
+
+    Parameters
+    ----------
+    x, psi_x0, V_x, m, fft : as for Schrodinger
+    dt : float
+        The small time interval over which to integrate
+    Nsteps : int
+        The total number of time steps
+    every : int, optional
+        Number of time steps between comparisons (default = 1)
+
+    Returns
+    -------
+    times : array
+        The times of the comparisons
+    error : array
+        The norm ||psi_64 - psi_128|| of the difference of the wave
+        functions (per row for an ensemble)
+    norm_error : array
+        The deviation |1 - ||psi_64||| of the single precision norm
+    """
+    single = Schrodinger(x, psi_x0, V_x, m=m, fft=fft, dtype=np.complex64)
+    double = Schrodinger(x, psi_x0, V_x, m=m, fft=fft, dtype=np.complex128)
+    times = []
+    error = []
+    norm_error = []
+    for step in xrange(0, Nsteps, every):
+        single.time_step(dt, min(every, Nsteps - step))
+        double.time_step(dt, min(every, Nsteps - step))
+        psi_single = single.psi_x
+        difference = psi_single - double.psi_x
+        times.append(double.t)
+        error.append(np.sqrt(double.dx * np.sum(np.abs(difference) ** 2, axis=-1)))
+        norm_error.append(np.abs(1 - 1 / single.wf_norm(psi_single).ravel()))
+    return np.array(times), np.array(error), np.squeeze(np.array(norm_error))
+
+def compare_integrators(x, psi_x0, V_x, t, dts, names=None, m=1, fft=None):
+    """
+    Measure the error against the cost of the splitting schemes of the
+    integrators module, by propagating the same initial state to time t
+    with each scheme and time step and comparing with a yoshida6
+    reference run with a quarter of the smallest time step.
+
+    For a gaussian packet (p0 = 5) scattering off a gaussian barrier
+    (height 10, width 1) on a 2**11 point grid over 40 units, propagated
+    to t = 2, the cost in FFT pairs to reach an error ||psi - psi_ref||
+    of 1e-4 was about 175 for strang, 135 for yoshida4, 80 for suzuki4,
+    50 for blanes_moan4 and 250 for yoshida6, and to reach 1e-8 about
+    18000, 1400, 800, 500 and 1200. blanes_moan4 was the cheapest
+    scheme at every error, and errors below about 5e-12 are limited by
+    roundoff.
+    The table in the README gives the full measurement.
+
+    Parameters
+    ----------
+    x, psi_x0, V_x, m, fft : as for Schrodinger
+    t : float
+        The time to propagate to
+    dts : list of floats
+        The time steps, each is adjusted to divide t
+    names : list of strings, optional
+        The schemes to compare (default = all schemes)
+
+    Returns
+    -------
+    results : dict
+        For each scheme a tuple of arrays (cost, error), the number of
+        FFT pairs and the norm ||psi - psi_ref|| of the error at time t
+        for each time step
+    """
+    if names is None:
+        names = sorted(integrators.schemes)
+    Nsteps_ref = int(np.ceil(4 * t / min(dts)))
+    reference = Schrodinger(x, psi_x0, V_x, m=m, fft=fft, integrator="yoshida6")
+    reference.time_step(float(t) / Nsteps_ref, Nsteps_ref)
+    results = {}
+    for name in names:
+        cost = []
+        error = []
+        for dt in dts:
+            Nsteps = max(int(np.round(t / dt)), 1)
+            solver = Schrodinger(x, psi_x0, V_x, m=m, fft=fft, integrator=name)
+            solver.time_step(float(t) / Nsteps, Nsteps)
+            difference = solver.psi_x - reference.psi_x
+            cost.append(Nsteps * solver.integrator.stages)
+            error.append(np.sqrt(solver.dx * np.sum(np.abs(difference) ** 2, axis=-1)))
+        results[name] = (np.array(cost), np.array(error))
+    return results
@@ -0,0 +1,267 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Energy spectra from a single real time propagation.
+
+The autocorrelation C(t) = <psi(0)|psi(t)> = sum_k |c_k|**2 exp(-1j E_k t)
+of a state with components c_k on the eigenstates of H holds the
+energies E_k of all the eigenstates the state overlaps. It is recorded
+in the time step loop by the autocorrelation observable, and the
+energies are extracted from it either by a windowed FFT (spectrum and
+peaks), which resolves energies separated by more than about 2 pi/T for
+a run of length T, or by filter diagonalization (filter_diagonalization),
+which fits the signal in an energy window and resolves far closer
+energies from the same run. The eigenfunctions are recovered by
+filtering the stored trajectory at the energies found
+(filter_eigenfunctions).
+
+C(t) has to be sampled finely enough to resolve the highest energy
+present, the sampling interval tau gives energies modulo 2 pi/tau.
+
+References
+- V. A. Mandelshtam and H. S. Taylor, J. Chem. Phys. 107, 6756 (1997)
+- M. R. Wall and D. Neuhauser, J. Chem. Phys. 102, 8011 (1995)
+
+AUTHOR: Luke Siemens
+"""
+
+import numpy as np
+from scipy import linalg
+
+import observables
+
+def autocorrelation(solver, every=1, name="autocorrelation"):
+    """
+    Returns an observable recording C(t) = <psi(t0)|psi(t)>, where psi(t0)
+    is the current state of solver, for Schrodinger.add_observable. The
+    value at t0 is recorded immediately. It is evaluated in x-space, at
+    the exact end of every every-th substep, for an ensemble C has one
+    entry per row.
+
+    Parameters
+    ----------
+    solver : Schrodinger
+        The solver whose current state is psi(t0)
+    every : int, optional
+        Number of substeps between evaluations (default = 1)
+    name : string, optional
+        The name of the observable (default = "autocorrelation")
+    """
+    conj_mod_x0 = np.conj(solver.psi_mod_x)
+    def func(S, mod_x, mod_p):
+        return 2 * np.pi / S.dx * np.sum(conj_mod_x0 * mod_x, axis=-1)
+    observable = observables._Builtin(name, func, "x", every)
+    observable._reserve(1)
+    observable._record(solver.t, func(solver, solver.psi_mod_x, None))
+    return observable
+
+def _window(name, n):
+    """
+    Returns a window over n samples falling from one to zero.
+    """
+    if name is None:
+        return np.ones(n)
+    phase = np.pi * np.arange(n) / n
+    if name == "hann":
+        return 0.5 + 0.5 * np.cos(phase)
+    if name == "blackman":
+        return 0.42 + 0.5 * np.cos(phase) + 0.08 * np.cos(2 * phase)
+    raise ValueError("unknown window " + str(name) + ".")
+
+def spectrum(times, C, window="blackman", pad=4):
+    """
+    Returns the spectral density S(E) = 1/(2 pi) int C(t) exp(1j E t) dt
+    of an autocorrelation sampled at the evenly spaced times t0, t0 + tau,
+    ..., extended to negative times by C(-t) = conj(C(t)) and damped by
+    a window. S(E) integrates to C(t0).
+
+    Parameters
+    ----------
+    times : array_like
+        The evenly spaced sample times, starting with t0
+    C : array_like
+        The autocorrelation at those times
+    window : string or None, optional
+        "blackman", "hann" or None for no window. Each peak of S(E) has
+        sidelobes, up to about 3e-2 of its height for hann and 1.3e-3
+        for blackman, which has wider peaks (default = "blackman")
+    pad : int, optional
+        The signal is zero padded to pad times its length, to sample
+        S(E) more finely (default = 4)
+
+    Returns
+    -------
+    energy : array
+        The energies, between -pi/tau and pi/tau
+    S : array
+        The spectral density at those energies
+    """
+    times = np.asarray(times)
+    C = np.asarray(C) * _window(window, len(times))
+    tau = times[1] - times[0]
+    n = pad * len(C)
+    transform = n * np.fft.ifft(C, n)
+    S = tau / np.pi * (np.real(transform) - 0.5 * np.real(C[0]))
+    energy = 2 * np.pi * np.fft.fftfreq(n, tau)
+    order = np.argsort(energy)
+    return energy[order], S[order]
+
+def peaks(energy, S, threshold=1e-2):
+    """
+    Returns the energies and heights of the local maxima of a spectral
+    density higher than threshold (default = 1e-2) times its maximum,
+    refined by fitting a parabola through each maximum and its
+    neighbours. The threshold should be above the sidelobes of the
+    window used by spectrum.
+    """
+    energy = np.asarray(energy)
+    S = np.asarray(S)
+    i = np.nonzero((S[1:-1] > S[:-2]) & (S[1:-1] >= S[2:])
+                   & (S[1:-1] > threshold * np.max(S)))[0] + 1
+    left, centre, right = S[i - 1], S[i], S[i + 1]
+    curvature = left - 2 * centre + right
+    offset = 0.5 * (left - right) / curvature
+    dE = energy[1] - energy[0]
+    return energy[i] + offset * dE, centre - 0.25 * (left - right) * offset
+
+def filter_diagonalization(times, C, E_min, E_max, density=1.0, rcond=1e-10):
+    """
+    Extract the energies in [E_min, E_max] from an autocorrelation by
+    filter diagonalization. The signal C_n = C(t0 + n tau) is fitted by
+    sum_k d_k exp(-1j E_k n tau) by solving the small generalized
+    eigenvalue problem of the propagator exp(-1j H tau) in a basis of
+    states filtered at K energies spread over the window. Energies
+    separated by well under 2 pi/T are resolved, spurious solutions are
+    recognized by their small amplitudes d_k or large widths.
+
+    Parameters
+    ----------
+    times : array_like
+        The evenly spaced sample times
+    C : array_like
+        The autocorrelation at those times
+    E_min, E_max : float
+        The energy window
+    density : float, optional
+        The number of basis energies per 2 pi/T of the window
+        (default = 1.0)
+    rcond : float, optional
+        Relative cutoff of the singular values of the overlap matrix of
+        the basis (default = 1e-10)
+
+    Returns
+    -------
+    energy : array
+        The energies in the window, in increasing order
+    width : array
+        Their imaginary parts, which vanish for exact eigenenergies
+    amplitude : array
+        The weights d_k, |c_k|**2 for the autocorrelation of a state
+    """
+    times = np.asarray(times)
+    C = np.asarray(C, dtype=complex)
+    tau = times[1] - times[0]
+    M = (len(C) - 3) // 2
+    assert M >= 1
+    K = max(int(np.ceil(density * (E_max - E_min) * M * tau / (2 * np.pi))), 1)
+    z = np.exp(-1j * tau * np.linspace(E_min, E_max, K))
+
+    # g_p(z) = sum_{n<=M} z**-n C_{n+p} and h_p(z) = sum_{n<=M} z**-n C_{n+p+M+1}
+    powers = z[np.newaxis, :] ** -np.arange(2 * M + 1)[:, np.newaxis]
+    g = [np.dot(C[p:p + M + 1], powers[:M + 1]) for p in (0, 1)]
+    h = [np.dot(C[p + M + 1:p + 2 * M + 2], powers[:M + 1]) for p in (0, 1)]
+    weights = M + 1 - np.abs(M - np.arange(2 * M + 1))
+    z_i = z[:, np.newaxis]
+    z_j = z[np.newaxis, :]
+    difference = z_i - z_j
+    np.fill_diagonal(difference, 1)
+    U = []
+    for p in (0, 1):
+        U_p = (z_i * g[p][np.newaxis, :] - z_j * g[p][:, np.newaxis]
+               - z_i ** -M * h[p][np.newaxis, :] + z_j ** -M * h[p][:, np.newaxis]) / difference
+        U_p[np.diag_indices(K)] = np.dot(weights * C[p:p + 2 * M + 1], powers)
+        U.append(U_p)
+
+    # U_0 is singular once the basis holds more states than the signal,
+    # the problem is solved in the span of its significant singular
+    # vectors
+    L, sigma, R = linalg.svd(U[0])
+    r = np.sum(sigma > rcond * sigma[0])
+    R = np.conj(R[:r]).T
+    u, y = linalg.eig(np.dot(np.conj(L[:, :r]).T, np.dot(U[1], R)) / sigma[:r, np.newaxis])
+    B = np.dot(R, y)
+    B /= np.sqrt(np.sum(B * np.dot(U[0], B), axis=0))
+    amplitude = np.dot(g[0], B) ** 2
+    E = 1j * np.log(u) / tau
+    keep = np.isfinite(E) & (np.real(E) >= E_min) & (np.real(E) <= E_max)
+    order = np.argsort(np.real(E[keep]))
+    return np.real(E[keep])[order], np.imag(E[keep])[order], amplitude[keep][order]
+
+def filter_eigenfunctions(trajectory, energies, window="blackman", chunk=64):
+    """
+    Returns the eigenfunctions at the given energies, reconstructed by
+    filtering a stored trajectory of psi_x as
+    psi_E(x) = sum_n w(t_n) exp(1j E t_n) psi(x, t_n), normalized. The
+    eigenfunctions at two energies are separated when the energies are
+    further apart than about 2 pi/T.
+
+    Parameters
+    ----------
+    trajectory : trajectory.TrajectoryReader
+        A trajectory of psi_x with evenly spaced times, or any object
+        with the attributes frames, times and axis
+    energies : array_like
+        The energies, such as those found by filter_diagonalization
+    window : string or None, optional
+        As for spectrum (default = "blackman")
+    chunk : int, optional
+        Number of frames read at a time (default = 64)
+
+    Returns
+    -------
+    eigenfunctions : array
+        (len(energies), N) array of the normalized eigenfunctions
+    """
+    energies = np.atleast_1d(energies)
+    times = np.asarray(trajectory.times)
+    weights = _window(window, len(times))
+    dx = trajectory.axis[1] - trajectory.axis[0]
+    frames = trajectory.frames
+    eigenfunctions = np.zeros((len(energies),) + frames.shape[1:], dtype=complex)
+    for start in xrange(0, len(times), chunk):
+        stop = min(start + chunk, len(times))
+        phases = weights[start:stop] * np.exp(1j * np.outer(energies, times[start:stop] - times[0]))
+        eigenfunctions += np.dot(phases, np.asarray(frames[start:stop]))
+    norm = np.sqrt(dx * np.sum(np.abs(eigenfunctions) ** 2, axis=-1))
+    return eigenfunctions / norm[:, np.newaxis]
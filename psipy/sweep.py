@@ -0,0 +1,194 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Parameter sweeps of independent Schrodinger runs over a process pool.
+
+Every point of a parameter grid is an independent run: a scenario
+factory builds the potential and initial state for the point, the
+solver is advanced for a fixed number of steps and a measure function
+reduces the final state to a few numbers, for example the transmission
+and reflection probabilities of a barrier. The x grid and the kinetic
+propagator, which are the same for every point, are placed in shared
+memory once and used by all worker processes. Results are appended to
+a csv file as the points finish, and points already in the file are
+skipped so an interrupted sweep can be resumed.
+
+AUTHOR: Luke Siemens
+"""
+
+import csv
+import itertools
+import multiprocessing
+import os
+from multiprocessing import sharedctypes
+
+import numpy as np
+
+from propagator_cache import PropagatorCache
+from schrodinger import Schrodinger, kinetic_key
+
+def parameter_grid(**axes):
+    """
+    Returns the list of all combinations of the given parameter values
+    as dictionaries, for example parameter_grid(height=[1, 2], p0=[1, 2])
+    """
+    names = sorted(axes.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[axes[name] for name in names])]
+
+def transmission_reflection(x_left, x_right):
+    """
+    Returns a measure function giving the reflection probability R, the
+    probability of x < x_left, and the transmission probability T, the
+    probability of x >= x_right.
+    """
+    def measure(S, **params):
+        prob = np.real(np.conj(S.psi_x) * S.psi_x) * S.dx
+        return {"R":np.sum(prob[S.x < x_left]), "T":np.sum(prob[S.x >= x_right])}
+    return measure
+
+def _to_shared(array):
+    array = np.ascontiguousarray(array)
+    shared = sharedctypes.RawArray("b", array.nbytes)
+    np.frombuffer(shared, dtype=array.dtype).reshape(array.shape)[...] = array
+    return shared, array.dtype.str, array.shape
+
+def _from_shared(shared):
+    buffer, dtype, shape = shared
+    return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+
+_worker = {}
+
+def _init_worker(shared_x, shared_p_evolve, factory, measure, dt, Nsteps, m, fft):
+    x = _from_shared(shared_x)
+    cache = PropagatorCache()
+    cache.put(kinetic_key(dt, m, len(x), x[1] - x[0]), _from_shared(shared_p_evolve))
+    _worker.update(x=x, cache=cache, factory=factory, measure=measure, dt=dt,
+                   Nsteps=Nsteps, m=m, fft=fft)
+
+def _run_point(params):
+    w = _worker
+    V_x, psi_x0 = w["factory"](w["x"], **params)
+    S = Schrodinger(w["x"], psi_x0, V_x, m=w["m"], fft=w["fft"], cache=w["cache"])
+    S.time_step(w["dt"], w["Nsteps"])
+    return params, w["measure"](S, **params)
+
+def _key(params, names):
+    return tuple(repr(params[name]) for name in names)
+
+def sweep(grid, factory, measure, x, dt, Nsteps, m=1, path=None, processes=None, fft=None):
+    """
+    Run one simulation per point of grid over a process pool.
+
+    Parameters
+    ----------
+    grid : list of dicts
+        The parameter points, see parameter_grid
+    factory : callable
+        factory(x, **params) returning (V_x, psi_x0) for a point
+    measure : callable
+        measure(S, **params) returning a dictionary of results from the
+        final state of the solver S
+    x : array_like, float
+        Length-N array of evenly spaced spatial coordinates
+    dt : float
+        The small time interval over which to integrate
+    Nsteps : int
+        The number of time steps of each run
+    m : float, optional
+        Particle mass (default = 1)
+    path : string, optional
+        csv file the results are appended to as they finish, points
+        already in the file are skipped (default = None)
+    processes : int, optional
+        Number of worker processes, 1 runs in this process
+        (default = number of cpus)
+    fft : string, optional
+        The FFT backend of the solvers (default = "fftpack")
+
+    Returns
+    -------
+    rows : list of dicts
+        The parameters and results of the points run by this call
+    """
+    names = sorted(grid[0].keys()) if grid else []
+    done = set()
+    fields = None
+    if path is not None and os.path.exists(path):
+        with open(path) as store:
+            reader = csv.DictReader(store)
+            fields = reader.fieldnames
+            for row in reader:
+                done.add(tuple(row[name] for name in names))
+    todo = [params for params in grid if _key(params, names) not in done]
+
+    x = np.asarray(x, dtype=float)
+    p = -np.pi / (x[1] - x[0]) + 2 * np.pi / (len(x) * (x[1] - x[0])) * np.arange(len(x))
+    shared_x = _to_shared(x)
+    shared_p_evolve = _to_shared(np.exp(-0.5 * 1j * p ** 2 * dt / m))
+    initargs = (shared_x, shared_p_evolve, factory, measure, dt, Nsteps, m, fft)
+
+    if processes == 1:
+        _init_worker(*initargs)
+        pool = None
+        results = itertools.imap(_run_point, todo)
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        results = pool.imap_unordered(_run_point, todo)
+
+    store = None
+    writer = None
+    rows = []
+    try:
+        for params, result in results:
+            row = dict(params)
+            row.update(result)
+            rows.append(row)
+            if path is None:
+                continue
+            if writer is None:
+                new_file = fields is None
+                if new_file:
+                    fields = names + sorted(result.keys())
+                store = open(path, "a")
+                writer = csv.DictWriter(store, fields)
+                if new_file:
+                    writer.writeheader()
+            writer.writerow(dict((name, repr(value)) for name, value in row.items()))
+            store.flush()
+    finally:
+        if store is not None:
+            store.close()
+        if pool is not None:
+            pool.terminate()
+    return rows
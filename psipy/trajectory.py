@@ -0,0 +1,254 @@
+####
+#
+# Copyright (c) 2015, Luke Siemens
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright 
+# notice, this list of conditions and the following disclaimer in the 
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its 
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A 
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT 
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, 
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT 
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE 
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+####
+
+"""
+Streaming storage of wave function snapshots from long runs.
+
+Frames are buffered in chunks of a fixed number of frames and appended
+to disk as each chunk fills, so memory use does not grow with the
+length of the run. Two formats are supported, HDF5 files (requires
+h5py) and raw binary files which are read back through numpy.memmap
+with a small json index stored beside them (path + ".json",
+path + ".times" and path + ".axis.npy").
+
+AUTHOR: Luke Siemens
+"""
+
+import json
+import os
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+_quantities = {"psi_x":("x", False), "psi_p":("p", False),
+               "prob_x":("x", True), "prob_p":("p", True)}
+
+def _is_hdf5(path, format):
+    if format is None:
+        return os.path.splitext(path)[1] in (".h5", ".hdf5")
+    if format not in ("hdf5", "raw"):
+        raise ValueError("unknown trajectory format " + str(format) + ".")
+    return format == "hdf5"
+
+class TrajectoryWriter(object):
+    """
+    Write snapshots of a Schrodinger solver to disk.
+
+    Parameters
+    ----------
+    path : string
+        The output file, files ending in .h5 or .hdf5 are written as
+        HDF5 unless format is given
+    quantity : string, optional
+        The stored quantity, one of "psi_x", "psi_p", "prob_x"
+        (|psi_x|**2) or "prob_p" (|psi_p|**2) (default = "psi_x")
+    dtype : numpy dtype, optional
+        The stored data type, for example numpy.complex64 for psi_x or
+        numpy.float16 for prob_x (default = complex128 or float64)
+    stride : int, optional
+        Only every stride'th grid point is stored (default = 1)
+    chunk : int, optional
+        Number of frames buffered in memory before being written
+        (default = 64)
+    format : string, optional
+        "hdf5" or "raw" (default = chosen from the extension of path)
+    """
+    def __init__(self, path, quantity="psi_x", dtype=None, stride=1, chunk=64, format=None):
+        if quantity not in _quantities:
+            raise ValueError("unknown quantity " + str(quantity) + ".")
+        space, is_prob = _quantities[quantity]
+        if dtype is None:
+            dtype = float if is_prob else complex
+        self.dtype = np.dtype(dtype)
+        if not is_prob and self.dtype.kind != "c":
+            raise ValueError(quantity + " must be stored with a complex dtype.")
+        assert stride >= 1 and chunk >= 1
+        self.path = path
+        self.quantity = quantity
+        self.space = space
+        self.stride = stride
+        self.chunk = chunk
+        self.hdf5 = _is_hdf5(path, format)
+        if self.hdf5 and h5py is None:
+            raise ImportError("writing HDF5 trajectories requires h5py.")
+        self.n_frames = 0
+        self._buffer = None
+        self._times = np.zeros(chunk)
+        self._filled = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _frame(self, solver):
+        psi = solver.psi_x if self.space == "x" else solver.psi_p
+        psi = psi[..., ::self.stride]
+        if _quantities[self.quantity][1]:
+            psi = np.real(np.conj(psi) * psi)
+        return psi
+
+    def _open(self, solver, frame):
+        axis = (solver.x if self.space == "x" else solver.p)[::self.stride]
+        self.frame_shape = frame.shape
+        self._buffer = np.zeros((self.chunk,) + frame.shape, dtype=self.dtype)
+        if self.hdf5:
+            self._file = h5py.File(self.path, "w")
+            self._frames = self._file.create_dataset("frames", (0,) + frame.shape,
+                                                     maxshape=(None,) + frame.shape,
+                                                     chunks=(self.chunk,) + frame.shape,
+                                                     dtype=self.dtype)
+            self._time_set = self._file.create_dataset("times", (0,), maxshape=(None,),
+                                                       chunks=(self.chunk,), dtype=float)
+            self._file.create_dataset("axis", data=axis)
+            self._file.attrs["quantity"] = self.quantity
+        else:
+            self._file = open(self.path, "wb")
+            self._time_file = open(self.path + ".times", "wb")
+            np.save(self.path + ".axis.npy", axis)
+
+    def write(self, solver):
+        """
+        Append a snapshot of the current state of solver.
+        """
+        frame = self._frame(solver)
+        if self._file is None:
+            self._open(solver, frame)
+        assert frame.shape == self.frame_shape
+        self._buffer[self._filled] = frame
+        self._times[self._filled] = np.real(solver.t)
+        self._filled += 1
+        if self._filled == self.chunk:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered frames to disk.
+        """
+        if self._file is None or self._filled == 0:
+            return
+        frames = self._buffer[:self._filled]
+        times = self._times[:self._filled]
+        n = self.n_frames + self._filled
+        if self.hdf5:
+            self._frames.resize(n, axis=0)
+            self._frames[self.n_frames:] = frames
+            self._time_set.resize(n, axis=0)
+            self._time_set[self.n_frames:] = times
+            self._file.flush()
+        else:
+            self._file.write(frames.tobytes())
+            self._file.flush()
+            self._time_file.write(times.tobytes())
+            self._time_file.flush()
+        self.n_frames = n
+        self._filled = 0
+        if not self.hdf5:
+            self._write_index()
+
+    def _write_index(self):
+        index = {"quantity":self.quantity, "dtype":self.dtype.str,
+                 "frame_shape":list(self.frame_shape), "n_frames":self.n_frames}
+        with open(self.path + ".json.tmp", "w") as index_file:
+            json.dump(index, index_file)
+        os.rename(self.path + ".json.tmp", self.path + ".json")
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        if not self.hdf5:
+            self._time_file.close()
+        self._file = None
+
+class TrajectoryReader(object):
+    """
+    Read a trajectory written by TrajectoryWriter. Frames are loaded
+    from disk only when they are indexed.
+
+    Parameters
+    ----------
+    path : string
+        The trajectory file
+    format : string, optional
+        "hdf5" or "raw" (default = chosen from the extension of path)
+    """
+    def __init__(self, path, format=None):
+        self.path = path
+        self.hdf5 = _is_hdf5(path, format)
+        if self.hdf5:
+            if h5py is None:
+                raise ImportError("reading HDF5 trajectories requires h5py.")
+            self._file = h5py.File(path, "r")
+            self.frames = self._file["frames"]
+            self.times = self._file["times"][...]
+            self.axis = self._file["axis"][...]
+            self.quantity = str(self._file.attrs["quantity"])
+        else:
+            self._file = None
+            with open(path + ".json") as index_file:
+                index = json.load(index_file)
+            self.quantity = str(index["quantity"])
+            n = index["n_frames"]
+            shape = (n,) + tuple(index["frame_shape"])
+            dtype = np.dtype(str(index["dtype"]))
+            if n > 0:
+                self.frames = np.memmap(path, dtype=dtype, mode="r", shape=shape)
+            else:
+                self.frames = np.zeros(shape, dtype=dtype)
+            self.times = np.fromfile(path + ".times", dtype=float, count=n)
+            self.axis = np.load(path + ".axis.npy")
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None